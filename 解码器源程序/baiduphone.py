@@ -1,7 +1,12 @@
 ﻿#!py -3
 #encoding: utf-8
 
-__all__ = ('Record', 'File')
+__all__ = ('Record', 'File', 'Writer')
+
+import mmap
+import struct
+
+HEAD = struct.Struct('<B27I')
 
 class Record:
     def __init__(self):
@@ -48,6 +53,27 @@ class Record:
         except ValueError:
             return None
 
+    @classmethod
+    def unpack_from(cls, buffer, offset=0):
+        if offset + 2 > len(buffer):
+            message = 'byte expected'
+            raise ValueError(message)
+        code_length = buffer[offset]
+        value_length = buffer[offset + 1]
+        begin = offset + 2
+        middle = begin + code_length
+        end = middle + value_length
+        if end + 4 > len(buffer):
+            message = 'bad record length'
+            raise ValueError(message)
+        if buffer[end : end + 4] != b'\0\0\0\0':
+            message = 'reserved flag must be zero'
+            raise ValueError(message)
+        record = cls()
+        record.__codes = buffer[begin : middle].decode('ascii').split()
+        record.__value = buffer[middle : end].decode('utf-16le').rstrip('\0')
+        return record, end + 4
+
     @classmethod
     def _read_record(cls, stream):
         code_length = cls._read_byte(stream)
@@ -113,6 +139,10 @@ class File:
     def records(self):
         return self.__records
 
+    @property
+    def offsets(self):
+        return self.__offsets
+
     @classmethod
     def read(cls, stream):
         try:
@@ -130,6 +160,42 @@ class File:
         except ValueError:
             return None
 
+    @classmethod
+    def from_buffer(cls, buffer):
+        try:
+            file = cls()
+            file.__max_length, *file.__offsets = HEAD.unpack_from(buffer)
+            offset = HEAD.size
+            while offset < len(buffer):
+                record, offset = Record.unpack_from(buffer, offset)
+                file.__records.append(record)
+            return file
+        except (ValueError, struct.error):
+            return None
+
+    @classmethod
+    def records_of(cls, buffer, letter):
+        offsets = HEAD.unpack_from(buffer)[1 : ]
+        index = ord(letter.lower()) - ord('a')
+        if not 0 <= index < 26:
+            message = 'letter expected'
+            raise ValueError(message)
+        offset = HEAD.size + offsets[index]
+        end = HEAD.size + offsets[index + 1]
+        records = []
+        while offset < end:
+            record, offset = Record.unpack_from(buffer, offset)
+            records.append(record)
+        return records
+
+    @classmethod
+    def load(cls, path, letter=None):
+        with open(path, 'rb') as fin:
+            with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                if letter is None:
+                    return cls.from_buffer(mapping)
+                return cls.records_of(mapping, letter)
+
     def __str__(self):
         string = ''
         string += 'MaxLength: %d' % self.__max_length
@@ -156,3 +222,59 @@ class File:
             prev_letter += 1
             head += len(body).to_bytes(4, 'little')
         return bytes(head + body)
+
+class Writer:
+    def __init__(self, stream, max_length=4):
+        self.__stream = stream
+        self.__max_length = max_length
+        self.__offsets = []
+        self.__size = 0
+        self.__letter = ord('a') - 1
+        self.__records = []
+        self.__latest = {}
+        self.__last = -1
+        self.__stream.write(bytes(HEAD.size))
+
+    def __flush(self):
+        for record in self.__records:
+            bs = record.to_bytes()
+            self.__stream.write(bs)
+            self.__size += len(bs)
+        self.__records = []
+        self.__latest = {}
+
+    def __advance(self, letter):
+        if letter < self.__letter:
+            message = 'codes must be written in sorted order'
+            raise ValueError(message)
+        if letter > self.__letter:
+            self.__flush()
+        while self.__letter < letter:
+            self.__letter += 1
+            self.__offsets.append(self.__size)
+
+    def write(self, code, values):
+        self.__advance(ord(code[0]))
+        self.__last = -1
+        for value in values:
+            index = self.__latest.get(value)
+            if index is not None and index > self.__last:
+                record = self.__records[index]
+                if len(' '.join(record.codes)) + 1 + len(code) <= 0xFF:
+                    record.codes.append(code)
+                    self.__last = index
+                    continue
+            record = Record()
+            record.value = value
+            record.codes.append(code)
+            self.__last = self.__latest[value] = len(self.__records)
+            self.__records.append(record)
+
+    def close(self):
+        self.__flush()
+        while self.__letter <= ord('z'):
+            self.__letter += 1
+            self.__offsets.append(self.__size)
+        self.__stream.seek(0)
+        self.__stream.write(HEAD.pack(self.__max_length, *self.__offsets))
+        self.__stream.seek(0, 2)
@@ -0,0 +1,111 @@
+﻿#!py -3
+#encodding: utf-8
+
+__all__ = ('Graph', 'plan', 'run')
+
+import os
+import os.path
+import concurrent.futures
+import coders
+import tables
+import manifest
+import instrument
+
+ROOT = os.path.realpath(os.path.dirname(__file__))
+BINARY = os.path.join(ROOT, '../大一统2014原始二进制码表')
+BINARY2 = os.path.join(ROOT, '../大一统2014原始二进制码表2')
+STAGES = 'decode', 'encode'
+
+def call(name, function, args, settings):
+    instrument.configure(*settings)
+    instrument.reset()
+    with instrument.stage(name):
+        result = function(*args)
+    output = settings[2]
+    if output is not None:
+        instrument.write_profile('%s.%s' % (output, name.replace(':', '-')))
+    return result, instrument.records()
+
+class Graph:
+    def __init__(self):
+        self._nodes = {}
+
+    def add(self, name, function, args=(), deps=()):
+        if name in self._nodes:
+            message = 'duplicate node %s' % name
+            raise ValueError(message)
+        for dep in deps:
+            if dep not in self._nodes:
+                message = 'unknown dependency %s' % dep
+                raise ValueError(message)
+        self._nodes[name] = (function, tuple(args), tuple(deps))
+
+    def __contains__(self, name):
+        return name in self._nodes
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def run(self, jobs=None):
+        waiting = {name: set(node[2]) for name, node in self._nodes.items()}
+        running = {}
+        results = {}
+        settings = instrument.settings()
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            while waiting or running:
+                for name in [name for name, deps in waiting.items() if not deps]:
+                    function, args, _ = self._nodes[name]
+                    running[executor.submit(call, name, function, args, settings)] = name
+                    del waiting[name]
+                finished, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        for pending in running:
+                            pending.cancel()
+                        raise error
+                    results[name], records = future.result()
+                    instrument.extend(records)
+                    for deps in waiting.values():
+                        deps.discard(name)
+        return results
+
+def generate(version, targets, force=False):
+    built = manifest.Manifest(tables.MANIFEST)
+    inputs = built.hash(tables.target_inputs(version))
+    stale = [target for target in targets
+             if force or not built.fresh(tables.target_output(version, target), inputs)]
+    if stale:
+        tables.generate_wubi(version, stale)
+    return [('%s:%s' % (target, version), tables.target_output(version, target), inputs)
+            for target in stale]
+
+def plan(targets=tables.TARGETS, versions=tables.VERSIONS, force=False, jobs=None):
+    graph = Graph()
+    deps = []
+    if 'decode' in targets:
+        graph.add('decode', coders.decode_folder, (BINARY, tables.SRC, force, False, jobs))
+        deps.append('decode')
+    if 'encode' in targets:
+        graph.add('encode', coders.encode_folder, (tables.SRC, BINARY2, force, jobs), deps)
+    outputs = [target for target in targets if target in tables.TARGETS]
+    if outputs:
+        for version in versions:
+            graph.add('tables:%s' % version, generate, (version, outputs, force), deps)
+    return graph
+
+def run(targets=tables.TARGETS, versions=tables.VERSIONS, jobs=None, force=False):
+    results = plan(targets, versions, force, jobs).run(jobs)
+    built = manifest.Manifest(tables.MANIFEST)
+    names = []
+    for name, result in results.items():
+        if name in STAGES:
+            names.append(name)
+            continue
+        for label, output, inputs in result:
+            built.record(output, inputs)
+            names.append(label)
+    built.save()
+    return names
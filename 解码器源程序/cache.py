@@ -0,0 +1,136 @@
+﻿#!py -3
+#encodding: utf-8
+
+__all__ = ('load_fullcode_file', 'load_shortcut_file', 'clear')
+
+import os
+import os.path
+import ctypes
+import hashlib
+import struct
+import tempfile
+import zlib
+import coders
+import fullcode
+import shortcut
+import manifest
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '.tablecache')
+CACHE_LIMIT = 64 * 1024 * 1024
+CACHE_MAGIC = b'WMWBTC02'
+CODE_MODULES = ('header', 'fields', 'fullcode', 'shortcut', 'coders', 'cache')
+
+HEAD = struct.Struct('<8sQQ32s32sI')
+
+_code_digest = None
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fin:
+        for bs in iter(lambda: fin.read(1024 * 1024), b''):
+            digest.update(bs)
+    return digest.digest()
+
+def _code_hash():
+    global _code_digest
+    if _code_digest is None:
+        digest = hashlib.sha256()
+        for path in manifest.module_files(*CODE_MODULES):
+            digest.update(_hash_file(path))
+        _code_digest = digest.digest()
+    return _code_digest
+
+def _cache_path(input, kind):
+    key = kind + ':' + os.path.realpath(input)
+    name = hashlib.sha1(key.encode()).hexdigest() + '.' + kind
+    return os.path.join(CACHE_DIR, name)
+
+def _read_cache(path, input, record_size):
+    stat = os.stat(input)
+    try:
+        with open(path, 'r+b') as fin:
+            head = fin.read(HEAD.size)
+            magic, size, mtime, digest, code, cached_record_size = HEAD.unpack(head)
+            if magic != CACHE_MAGIC or cached_record_size != record_size:
+                return None
+            if code != _code_hash():
+                return None
+            if (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+                if size != stat.st_size or digest != _hash_file(input):
+                    return None
+                fin.seek(0)
+                fin.write(HEAD.pack(magic, stat.st_size, stat.st_mtime_ns,
+                                    digest, code, record_size))
+                fin.seek(HEAD.size)
+            bs = zlib.decompress(fin.read())
+    except (OSError, struct.error, zlib.error):
+        return None
+    if len(bs) % record_size:
+        return None
+    os.utime(path)
+    return bytearray(bs)
+
+def _write_cache(path, input, record_size, records):
+    stat = os.stat(input)
+    head = HEAD.pack(CACHE_MAGIC, stat.st_size, stat.st_mtime_ns,
+                     _hash_file(input), _code_hash(), record_size)
+    body = zlib.compress(b''.join(map(bytes, records)), 1)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, name = tempfile.mkstemp(dir=CACHE_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as fout:
+            fout.write(head)
+            fout.write(body)
+        os.chmod(name, manifest.file_mode())
+        os.replace(name, path)
+    except OSError:
+        if os.path.exists(name):
+            os.remove(name)
+        return
+    _prune(path)
+
+def _prune(keep):
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= CACHE_LIMIT:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+def _load(input, kind, table_class, record_class, encode):
+    path = _cache_path(input, kind)
+    record_size = ctypes.sizeof(record_class)
+    bs = _read_cache(path, input, record_size)
+    if bs is None:
+        table = encode(input)
+        _write_cache(path, input, record_size, table)
+        return table
+    table = table_class()
+    table.extend((record_class * (len(bs) // record_size)).from_buffer(bs))
+    return table
+
+def load_fullcode_file(input):
+    return _load(input, 'qm', fullcode.Table, fullcode.Record,
+                 coders.encode_fullcode_file)
+
+def load_shortcut_file(input):
+    return _load(input, 'jm', shortcut.DenseTable, shortcut.Record,
+                 coders.encode_shortcut_file)
+
+def clear():
+    if os.path.isdir(CACHE_DIR):
+        for name in os.listdir(CACHE_DIR):
+            os.remove(os.path.join(CACHE_DIR, name))
@@ -0,0 +1,68 @@
+﻿#!py -3
+#encodding: utf-8
+
+__all__ = ('is_gb2312', 'gb18030_char_key', 'gb18030_key')
+
+import re
+import sys
+import array
+import itertools
+
+SURROGATE_BEGIN = 0xD800
+SURROGATE_END = 0xE000
+SUPPLEMENTARY_BASE = 0x90308130
+
+GB18030_TOKEN = re.compile(rb'[\x81-\xfe][\x30-\x39][\x81-\xfe][\x30-\x39]'
+                           rb'|[\x81-\xfe][\x40-\xfe]'
+                           rb'|[\x00-\x80\xff]')
+
+_gb2312 = None
+_gb18030 = None
+
+def _gb2312_chars():
+    chars = set(map(chr, range(0x80)))
+    for major in range(0xA1, 0xF8):
+        for minor in range(0xA1, 0xFF):
+            try:
+                chars.add(bytes([major, minor]).decode('gb2312'))
+            except UnicodeError:
+                pass
+    return frozenset(chars)
+
+def _gb18030_keys():
+    # GB18030 is prefix-free, so each character's bytes padded to four and read
+    # big-endian sort exactly like the encoded strings.
+    def encode(begin, end):
+        bs = ''.join(map(chr, range(begin, end))).encode('gb18030')
+        tokens = GB18030_TOKEN.findall(bs)
+        assert len(tokens) == end - begin
+        keys = array.array('I', b''.join(map(bytes.ljust, tokens,
+                                                 itertools.repeat(4),
+                                                 itertools.repeat(b'\0'))))
+        if sys.byteorder == 'little':
+            keys.byteswap()
+        return keys
+    keys = encode(0, SURROGATE_BEGIN)
+    keys.extend(itertools.repeat(0xFFFFFFFF, SURROGATE_END - SURROGATE_BEGIN))
+    keys.extend(encode(SURROGATE_END, 0x10000))
+    return keys
+
+def is_gb2312(value):
+    global _gb2312
+    if _gb2312 is None:
+        _gb2312 = _gb2312_chars()
+    return _gb2312.issuperset(value)
+
+def gb18030_char_key(c):
+    global _gb18030
+    if _gb18030 is None:
+        _gb18030 = _gb18030_keys()
+    n = ord(c)
+    if n < 0x10000:
+        return _gb18030[n]
+    n -= 0x10000
+    return SUPPLEMENTARY_BASE + (n // 12600 << 24) + (n // 1260 % 10 << 16) + \
+           (n // 10 % 126 << 8) + n % 10
+
+def gb18030_key(value):
+    return tuple(map(gb18030_char_key, value))
@@ -4,27 +4,51 @@
 __all__ = (
     'decode_radical_file',
     'encode_radical_folder',
+    'decode_radical_atlas',
+    'encode_radical_atlas',
     'decode_shortcut_file',
     'encode_shortcut_file',
     'decode_fullcode_file',
     'encode_fullcode_file',
+    'stream_shortcut_file',
+    'stream_fullcode_file',
+    'parse_fullcode_file',
+    'validate_fullcode_file',
+    'validate_folder',
     'decode_folder',
     'encode_folder',
 )
 
 import os
 import os.path
+import sys
+import io
 import glob
 import shutil
+import stat
+import ctypes
 import csv
+import codecs
+import json
+import tempfile
+import concurrent.futures
 import header
+import fields
 import radical
 import shortcut
 import fullcode
+import manifest
+import instrument
+
+STREAM_CHUNK_RECORDS = 4096
+VALIDATE_CHUNK_SIZE = 256 * 1024
+MANIFEST_NAME = '.manifest.json'
+CODER_MODULES = ('header', 'fields', 'radical', 'shortcut', 'fullcode', 'coders')
 
 def decode_radical_file(path, folder):
     with open(path, 'rb') as fin:
         table = radical.Table.read(fin)
+    instrument.count(records=len(table))
     for record in table:
         name = folder + os.sep + record.code + '.bmp'
         with open(name, 'wb') as fout:
@@ -46,9 +70,20 @@ def encode_radical_folder(folder):
         table.add(record)
     return table
 
+def decode_radical_atlas(path, output):
+    with open(path, 'rb') as fin:
+        table = radical.Table.read(fin)
+    with open(output, 'wb') as fout:
+        table.write_atlas(fout)
+
+def encode_radical_atlas(path):
+    with open(path, 'rb') as fin:
+        return radical.Table.read_atlas(fin)
+
 def decode_shortcut_file(input, output):
     with open(input, 'rb') as fin:
-        table = shortcut.Table.read(fin)
+        table = shortcut.DenseTable.read(fin)
+    instrument.count(records=len(table))
     with open(output, 'w', encoding='utf-8-sig', newline='') as fout:
         writer = csv.writer(fout)
         for record in table:
@@ -58,7 +93,7 @@ def decode_shortcut_file(input, output):
             writer.writerow(row)
 
 def encode_shortcut_file(input):
-    table = shortcut.Table()
+    table = shortcut.DenseTable()
     with open(input, 'r', encoding='utf-8-sig', newline='') as fin:
         reader = csv.reader(fin)
         for row in reader:
@@ -69,26 +104,30 @@ def encode_shortcut_file(input):
     return table
 
 def decode_fullcode_file(input, output):
-    with open(input, 'rb') as fin:
-        table = fullcode.Table.read(fin)
-    with open(output, 'w', encoding='utf-8-sig', newline='') as fout:
-        writer = csv.writer(fout)
-        for record in table:
-            row = []
-            row.append(record.tag)
-            row.append(record.code)
-            row.append(record.value)
-            if record.tag == 'word':
-                row.append(record.reading)
-                row.append(record.length)
-            elif record.tag in ('char', 'extended-char'):
-                row.append(record.reading)
-                row.append(record.reading2)
-                row.append(record.decomposition)
-                row.append(record.flag)
-                row.append(record.tolerance)
-                row.append(record.code6k)
-            writer.writerow(row)
+    with open(input, 'rb') as fin, fullcode.MappedTable.read(fin) as table:
+        instrument.count(records=len(table))
+        with open(output, 'w', encoding='utf-8-sig', newline='') as fout:
+            writer = csv.writer(fout)
+            writer.writerows(table.rows())
+
+def fullcode_row_problem(row):
+    if row[0] == 'word':
+        readings = row[3].split()
+        if readings or int(row[4]):
+            if len(readings) != int(row[4]):
+                return 'word-length'
+    elif row[0] in ('char', 'extended-char'):
+        code = ''.join(x[0] for x in row[5].split())
+        if code != row[1]:
+            return 'char-decomposition'
+    return None
+
+def check_fullcode_row(name, row):
+    problem = fullcode_row_problem(row)
+    if problem == 'word-length':
+        print('%s: word-length: %s' % (name, row[2]), file=sys.stderr)
+    elif problem == 'char-decomposition':
+        print('%s: char-decomposition: %s' % (name, row[1]), file=sys.stderr)
 
 def encode_fullcode_file(input):
     table = fullcode.Table()
@@ -97,59 +136,321 @@ def encode_fullcode_file(input):
         reader = csv.reader(fin)
         for row in reader:
             record = fullcode.Record()
-            record.tag = row[0]
-            record.code = row[1]
-            record.value = row[2]
-            if record.tag == 'word':
-                record.reading = row[3]
-                record.length = row[4]
-                if record.reading or record.length:
-                    if len(record.reading.split()) != record.length:
-                        print('%s: word-length: %s' % (name, record.value))
-            elif record.tag in ('char', 'extended-char'):
-                record.reading = row[3]
-                record.reading2 = row[4]
-                record.decomposition = row[5]
-                record.flag = row[6]
-                record.tolerance = row[7]
-                record.code6k = row[8]
-                code = ''.join(x[0] for x in record.decomposition.split())
-                if code != record.code:
-                    print('%s: char-decomposition: %s' % (name, record.code))
+            fullcode.pack_row(record, 0, row)
+            check_fullcode_row(name, row)
             table.add(record)
     return table
 
-def decode_folder(src, dst):
-    shutil.rmtree(dst, ignore_errors=True)
-    os.mkdir(dst)
+def stream_rows(rows, fout, size, pack):
+    buffer = bytearray(size * STREAM_CHUNK_RECORDS)
+    offset = 0
+    count = 0
+    for row in rows:
+        if offset == len(buffer):
+            fout.write(buffer)
+            offset = 0
+        pack(buffer, offset, row)
+        offset += size
+        count += 1
+    fout.write(memoryview(buffer)[ : offset])
+    instrument.count(records=count)
+
+def stream_shortcut_file(input, output):
+    def sorted_rows(reader):
+        prev_index = -1
+        for row in reader:
+            index = shortcut.code_to_index(row[0])
+            if index < prev_index:
+                message = 'shortcut rows are not sorted by code'
+                raise ValueError(message)
+            prev_index = index
+            yield row
+    with open(input, 'r', encoding='utf-8-sig', newline='') as fin:
+        with open(output, 'wb') as fout:
+            fout.write(header.HEADER_DATA)
+            rows = sorted_rows(csv.reader(fin))
+            stream_rows(rows, fout, shortcut.RECORD.size, shortcut.pack_row)
+
+def stream_fullcode_file(input, output):
+    def checked_rows(reader):
+        name = os.path.basename(input)
+        for row in reader:
+            check_fullcode_row(name, row)
+            yield row
+    with open(input, 'r', encoding='utf-8-sig', newline='') as fin:
+        with open(output, 'wb') as fout:
+            fout.write(header.HEADER_DATA)
+            rows = checked_rows(csv.reader(fin))
+            stream_rows(rows, fout, fields.RECORD_SIZE, fullcode.pack_row)
+
+def split_csv_file(input, chunk_size=VALIDATE_CHUNK_SIZE):
+    # A newline only ends a record outside quotes. With doubled quotes as the
+    # escape, that is wherever the number of quotes read so far is even.
+    chunks = []
+    quoted = 0
+    with open(input, 'rb') as fin:
+        begin = 3 if fin.read(3) == codecs.BOM_UTF8 else 0
+        fin.seek(begin)
+        while True:
+            data = fin.read(chunk_size)
+            if not data:
+                break
+            quoted ^= data.count(b'"') & 1
+            line = fin.readline()
+            quoted ^= line.count(b'"') & 1
+            while line and quoted:
+                line = fin.readline()
+                quoted ^= line.count(b'"') & 1
+            end = fin.tell()
+            chunks.append((begin, end))
+            begin = end
+    return chunks
+
+def parse_fullcode_chunk(input, begin, end):
+    with open(input, 'rb') as fin:
+        fin.seek(begin)
+        text = fin.read(end - begin).decode('utf-8')
+    rows = list(csv.reader(io.StringIO(text, newline='')))
+    buffer = bytearray(fields.RECORD_SIZE * len(rows))
+    offset = 0
+    problems = []
+    for index, row in enumerate(rows):
+        try:
+            fullcode.pack_row(buffer, offset, row)
+            problem = fullcode_row_problem(row)
+        except (ValueError, IndexError, KeyError, UnicodeError) as e:
+            problems.append((index, 'malformed', row, str(e)))
+            continue
+        if problem is not None:
+            problems.append((index, problem, row, None))
+        offset += fields.RECORD_SIZE
+    del buffer[offset : ]
+    return bytes(buffer), len(rows), problems
+
+def parse_fullcode_file(input, workers=None, chunk_size=VALIDATE_CHUNK_SIZE):
+    chunks = split_csv_file(input, chunk_size)
+    if workers == 1 or len(chunks) <= 1:
+        results = [parse_fullcode_chunk(input, begin, end) for begin, end in chunks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(parse_fullcode_chunk, input, begin, end)
+                       for begin, end in chunks]
+            results = [future.result() for future in futures]
+    blobs = []
+    problems = []
+    row_base = 1
+    for bs, count, chunk_problems in results:
+        blobs.append(bs)
+        for index, kind, row, detail in chunk_problems:
+            problem = {}
+            problem['row'] = row_base + index
+            problem['kind'] = kind
+            problem['tag'] = row[0] if row else ''
+            problem['code'] = row[1] if len(row) > 1 else ''
+            problem['value'] = row[2] if len(row) > 2 else ''
+            if detail is not None:
+                problem['detail'] = detail
+            problems.append(problem)
+        row_base += count
+    return b''.join(blobs), row_base - 1, problems
+
+def validate_fullcode_file(input, workers=None):
+    with instrument.stage('validate:%s' % os.path.basename(input)) as stage:
+        _, rows, problems = parse_fullcode_file(input, workers)
+        stage.records = rows
+    report = {}
+    report['file'] = os.path.basename(input)
+    report['rows'] = rows
+    report['problems'] = problems
+    return report
+
+def validate_folder(src, output=None, workers=None):
+    reports = []
+    for input in sorted(glob.glob(os.path.join(src, '*qm.dat.txt'))):
+        reports.append(validate_fullcode_file(input, workers))
+    if output is not None:
+        with open(output, 'w', encoding='utf-8') as fout:
+            json.dump(reports, fout, ensure_ascii=False, indent=1)
+    return reports
+
+def decode_radical_folder(path, target):
+    os.mkdir(target)
+    decode_radical_file(path, target)
+
+def encode_radical_file(folder, path):
+    table = encode_radical_folder(folder)
+    instrument.count(records=len(table))
+    with open(path, 'wb') as fout:
+        table.write(fout)
+
+def encode_radical_atlas_file(input, path):
+    table = encode_radical_atlas(input)
+    instrument.count(records=len(table))
+    with open(path, 'wb') as fout:
+        table.write(fout)
+
+def encode_shortcut_table(input, output):
+    table = encode_shortcut_file(input)
+    instrument.count(records=len(table))
+    with open(output, 'wb') as fout:
+        fout.write(header.HEADER_DATA)
+        table.write(fout)
+
+def encode_shortcut_stream(input, output):
+    try:
+        stream_shortcut_file(input, output)
+    except ValueError:
+        # Hand-edited tables may be out of order; DenseTable sorts them.
+        encode_shortcut_table(input, output)
+
+def remove_output(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def link_output(source, target):
+    if os.path.isdir(source):
+        shutil.copytree(source, target, copy_function=link_output)
+        return target
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+    return target
+
+def folder_mode(dst):
+    if os.path.isdir(dst):
+        return stat.S_IMODE(os.stat(dst).st_mode)
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o777 & ~umask
+
+def exchange_folders(folder, dst):
+    # renameat2(RENAME_EXCHANGE) swaps both names in one step; it only exists
+    # on Linux, everywhere else the caller falls back to two renames.
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, TypeError, AttributeError):
+        return False
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p,
+                          ctypes.c_uint]
+    AT_FDCWD = -100
+    RENAME_EXCHANGE = 2
+    return renameat2(AT_FDCWD, os.fsencode(folder), AT_FDCWD, os.fsencode(dst),
+                     RENAME_EXCHANGE) == 0
+
+def swap_folder(folder, dst):
+    os.chmod(folder, folder_mode(dst))
+    if not os.path.exists(dst):
+        os.rename(folder, dst)
+        return
+    if exchange_folders(folder, dst):
+        shutil.rmtree(folder, ignore_errors=True)
+        return
+    # Not atomic: dst is missing between the two renames, but it is never
+    # seen half-written.
+    old = tempfile.mkdtemp(dir=os.path.dirname(dst), prefix='.old.')
+    os.rmdir(old)
+    os.rename(dst, old)
+    try:
+        os.rename(folder, dst)
+    except OSError:
+        os.rename(old, dst)
+        raise
+    shutil.rmtree(old, ignore_errors=True)
+
+def output_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    size = 0
+    for folder, _, names in os.walk(path):
+        for name in names:
+            size += os.path.getsize(os.path.join(folder, name))
+    return size
+
+def run_folder_job(function, input, output, settings):
+    instrument.configure(*settings)
+    instrument.reset()
+    with instrument.stage('%s:%s' % (function.__name__, os.path.basename(input))) as stage:
+        function(input, output)
+        stage.bytes = output_size(output)
+    return instrument.records()
+
+def run_folder_jobs(jobs, dst, force=False, workers=None):
+    dst = os.path.abspath(dst)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    built = manifest.Manifest(os.path.join(dst, MANIFEST_NAME))
+    code = manifest.module_files(*CODER_MODULES)
+    pending = []
+    fresh = []
+    for function, input, output in jobs:
+        inputs = built.hash([input, *code])
+        if not force and built.fresh(output, inputs):
+            fresh.append(os.path.basename(output))
+        else:
+            pending.append((function, input, output, inputs))
+    expected = {MANIFEST_NAME, *fresh}
+    expected.update(os.path.basename(job[2]) for job in pending)
+    current = set(os.listdir(dst)) if os.path.isdir(dst) else set()
+    # Only outputs this manifest recorded are ours to remove; anything else in
+    # dst, like the hand-kept qm CSVs, is carried over into the new folder.
+    stale = {name for name in current - expected if os.path.join(dst, name) in built}
+    if not pending and not stale and expected <= current:
+        return
+    folder = tempfile.mkdtemp(dir=os.path.dirname(dst),
+                              prefix='.%s.' % os.path.basename(dst))
+    try:
+        for name in fresh + sorted(current - expected - stale):
+            link_output(os.path.join(dst, name), os.path.join(folder, name))
+        settings = instrument.settings()
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = []
+            for function, input, output, _ in pending:
+                target = os.path.join(folder, os.path.basename(output))
+                futures.append(executor.submit(run_folder_job, function, input, target,
+                                               settings))
+            for future in futures:
+                instrument.extend(future.result())
+        for _, _, output, inputs in pending:
+            built.record(output, inputs)
+        for name in stale:
+            built.forget(os.path.join(dst, name))
+        built.save(os.path.join(folder, MANIFEST_NAME))
+        swap_folder(folder, dst)
+    except BaseException:
+        shutil.rmtree(folder, ignore_errors=True)
+        raise
+
+def decode_folder(src, dst, force=False, atlas=False, workers=None):
+    jobs = []
     for path in glob.glob(os.path.join(src, '*zg.dat')):
         target = os.path.join(dst, os.path.basename(path))
-        os.mkdir(target)
-        decode_radical_file(path, target)
+        if atlas:
+            jobs.append((decode_radical_atlas, path, target + '.atlas'))
+        else:
+            jobs.append((decode_radical_folder, path, target))
     for input in glob.glob(os.path.join(src, '*jm.dat')):
         output = os.path.join(dst, os.path.basename(input) + '.txt')
-        decode_shortcut_file(input, output)
+        jobs.append((decode_shortcut_file, input, output))
     for input in glob.glob(os.path.join(src, '*qm.dat')):
         output = os.path.join(dst, os.path.basename(input) + '.txt')
-        decode_fullcode_file(input, output)
+        jobs.append((decode_fullcode_file, input, output))
+    run_folder_jobs(jobs, dst, force, workers)
 
-def encode_folder(src, dst):
-    shutil.rmtree(dst, ignore_errors=True)
-    os.mkdir(dst)
+def encode_folder(src, dst, force=False, workers=None):
+    jobs = []
     for folder in glob.glob(os.path.join(src, '*zg.dat')):
         path = os.path.join(dst, os.path.basename(folder))
-        table = encode_radical_folder(folder)
-        with open(path, 'wb') as fout:
-            table.write(fout)
+        jobs.append((encode_radical_file, folder, path))
+    for input in glob.glob(os.path.join(src, '*zg.dat.atlas')):
+        path = os.path.join(dst, os.path.basename(input)[ : -6])
+        if not os.path.isdir(input[ : -6]):
+            jobs.append((encode_radical_atlas_file, input, path))
     for input in glob.glob(os.path.join(src, '*jm.dat.txt')):
         output = os.path.join(dst, os.path.basename(input)[ : -4])
-        table = encode_shortcut_file(input)
-        with open(output, 'wb') as fout:
-            fout.write(header.HEADER_DATA)
-            table.write(fout)
+        jobs.append((encode_shortcut_stream, input, output))
     for input in glob.glob(os.path.join(src, '*qm.dat.txt')):
         output = os.path.join(dst, os.path.basename(input)[ : -4])
-        table = encode_fullcode_file(input)
-        with open(output, 'wb') as fout:
-            fout.write(header.HEADER_DATA)
-            table.write(fout)
+        jobs.append((stream_fullcode_file, input, output))
+    run_folder_jobs(jobs, dst, force, workers)
@@ -0,0 +1,226 @@
+﻿#!py -3
+#encodding: utf-8
+
+__all__ = (
+    'Change',
+    'diff',
+    'summarize',
+    'read_patch',
+    'write_patch',
+    'apply_patch',
+    'read_table',
+    'write_table',
+    'apply_file',
+)
+
+import os
+import os.path
+import csv
+import json
+import argparse
+import charset
+import sinks
+import tables
+
+FORMATS = 'jidian', 'qq', 'xiaoya', 'baidu'
+
+class Change:
+    def __init__(self, code, old, new):
+        self.code = code
+        self.old = list(old)
+        self.new = list(new)
+
+    @property
+    def added(self):
+        old = set(self.old)
+        return [value for value in self.new if value not in old]
+
+    @property
+    def removed(self):
+        new = set(self.new)
+        return [value for value in self.old if value not in new]
+
+    @property
+    def reordered(self):
+        old = set(self.old)
+        new = set(self.new)
+        before = [value for value in self.old if value in new]
+        after = [value for value in self.new if value in old]
+        return after if before != after else []
+
+    def to_dict(self):
+        change = {}
+        change['code'] = self.code
+        change['added'] = self.added
+        change['removed'] = self.removed
+        change['reordered'] = self.reordered
+        return change
+
+    def __str__(self):
+        return '%s +[%s] -[%s] ~[%s]' % (self.code, ' '.join(self.added),
+                                         ' '.join(self.removed), ' '.join(self.reordered))
+
+def diff(old, new):
+    changes = []
+    codes1 = sorted(old)
+    codes2 = sorted(new)
+    i = j = 0
+    while i < len(codes1) or j < len(codes2):
+        if j == len(codes2) or i < len(codes1) and codes1[i] < codes2[j]:
+            code = codes1[i]
+            values1, values2 = list(old[code]), []
+            i += 1
+        elif i == len(codes1) or codes2[j] < codes1[i]:
+            code = codes2[j]
+            values1, values2 = [], list(new[code])
+            j += 1
+        else:
+            code = codes1[i]
+            values1, values2 = list(old[code]), list(new[code])
+            i += 1
+            j += 1
+        if values1 != values2:
+            changes.append(Change(code, values1, values2))
+    return changes
+
+def summarize(changes):
+    summary = {}
+    summary['codes'] = len(changes)
+    summary['added'] = sum(len(change.added) for change in changes)
+    summary['removed'] = sum(len(change.removed) for change in changes)
+    summary['reordered'] = sum(1 for change in changes if change.reordered)
+    summary['changes'] = [change.to_dict() for change in changes]
+    return summary
+
+def write_patch(changes, fout):
+    writer = csv.writer(fout)
+    for change in changes:
+        writer.writerow([change.code, len(change.old), *change.old, *change.new])
+
+def read_patch(fin):
+    changes = []
+    for row in csv.reader(fin):
+        count = int(row[1])
+        changes.append(Change(row[0], row[2 : 2 + count], row[2 + count : ]))
+    return changes
+
+def apply_patch(table, changes, strict=True):
+    patched = {}
+    for change in changes:
+        current = list(table[change.code]) if change.code in table else []
+        if strict and current != change.old:
+            message = 'patch does not apply at code %s' % change.code
+            raise ValueError(message)
+        patched[change.code] = change.new
+    result = tables.CodeTable()
+    for code, values in table.items():
+        for value in patched.pop(code, values):
+            result.add(code, value)
+    for code, values in patched.items():
+        for value in values:
+            result.add(code, value)
+    return result
+
+def read_table(input, format):
+    if format not in FORMATS:
+        message = 'unknown format %s' % format
+        raise ValueError(message)
+    table = tables.CodeTable()
+    name = None
+    with open(input, 'r', encoding='utf-16', newline='\r\n') as fin:
+        lines = fin.read().split('\r\n')
+    if lines and not lines[-1]:
+        lines.pop()
+    if format == 'baidu':
+        groups = {}
+        for line in lines:
+            value, code = line.split('\t')
+            groups.setdefault(code, []).append(value)
+        for code, values in groups.items():
+            for value in reversed(values):
+                table.add(code, value)
+        return table, name
+    for line in lines:
+        if format == 'xiaoya' and line.startswith('[cmd:'):
+            if line.startswith('[cmd:Info='):
+                name = line[len('[cmd:Info=') : -1]
+            continue
+        code, *values = line.split(' ')
+        for value in values:
+            if format == 'jidian' and value.startswith('~') and \
+               not charset.is_gb2312(value[1 : ]):
+                value = value[1 : ]
+            table.add(code, value)
+    return table, name
+
+def write_table(table, output, format, name=None):
+    if format == 'jidian':
+        sink = sinks.JidianSink(output)
+    elif format == 'qq':
+        sink = sinks.QQSink(output)
+    elif format == 'xiaoya':
+        sink = sinks.XiaoyaSink(output, name)
+    elif format == 'baidu':
+        sink = sinks.BaiduSink(output)
+    else:
+        message = 'unknown format %s' % format
+        raise ValueError(message)
+    sinks.emit(table, [sink])
+
+def apply_file(input, patch, output, format, strict=True):
+    table, name = read_table(input, format)
+    with open(patch, 'r', encoding='utf-8-sig', newline='') as fin:
+        changes = read_patch(fin)
+    write_table(apply_patch(table, changes, strict), output, format, name)
+
+def load(spec, version='86', format=None):
+    if spec in tables.VERSIONS:
+        version, spec = spec, tables.SRC
+    if os.path.isdir(spec):
+        name = tables.NAMES[tables.VERSIONS.index(version)]
+        table, _, _ = tables.load_wangma_wubi(
+            version, name,
+            os.path.join(spec, 'wmwb%sqm.dat.txt' % version),
+            os.path.join(spec, 'wmwb%sjm.dat.txt' % version))
+        return table
+    if format is None:
+        message = 'format is required for %s' % spec
+        raise ValueError(message)
+    table, _ = read_table(spec, format)
+    return table
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('old',
+                        help='version (06, 86, 98), CSV folder or generated table')
+    parser.add_argument('new',
+                        help='version (06, 86, 98), CSV folder or generated table')
+    parser.add_argument('-v', '--version', choices=tables.VERSIONS, default='86',
+                        help='version of the tables in a CSV folder')
+    parser.add_argument('-f', '--format', choices=FORMATS,
+                        help='format of generated tables')
+    parser.add_argument('-p', '--patch', metavar='PATCH',
+                        help='write a patch from OLD to NEW')
+    parser.add_argument('-r', '--report', metavar='REPORT',
+                        help='write the differences as a JSON report')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='only print the summary')
+    args = parser.parse_args()
+    old = load(args.old, args.version, args.format)
+    new = load(args.new, args.version, args.format)
+    changes = diff(old, new)
+    if not args.quiet:
+        for change in changes:
+            print(change)
+    summary = summarize(changes)
+    print('%d codes changed, %d candidates added, %d removed, %d codes reordered' % (
+        summary['codes'], summary['added'], summary['removed'], summary['reordered']))
+    if args.patch is not None:
+        with open(args.patch, 'w', encoding='utf-8-sig', newline='') as fout:
+            write_patch(changes, fout)
+    if args.report is not None:
+        with open(args.report, 'w', encoding='utf-8') as fout:
+            json.dump(summary, fout, ensure_ascii=False, indent=1)
+
+if __name__ == '__main__':
+    main()
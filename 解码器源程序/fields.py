@@ -0,0 +1,118 @@
+﻿#!py -3
+#encodding: utf-8
+
+__all__ = (
+    'decode_code',
+    'encode_code',
+    'decode_value',
+    'encode_value',
+    'decode_decomposition',
+    'encode_decomposition',
+    'decode_reading',
+    'encode_reading',
+    'decode_reading2',
+    'encode_reading2',
+    'decode_tolerance',
+    'encode_tolerance',
+    'decode_code6k',
+    'encode_code6k',
+)
+
+import struct
+
+TAG = struct.Struct('<I')
+CHAR_RECORD = struct.Struct('<I4s4s8s42sH12s5s223s')
+WORD_RECORD = struct.Struct('<I4sb39s64s192s')
+STRING_RECORD = struct.Struct('<I4s296s')
+RECORD_SIZE = 304
+
+READING_LAYOUTS = {
+    7: struct.Struct('2s4s' * 7),
+    32: struct.Struct('2s4s' * 32)
+}
+TOLERANCE = struct.Struct('4s' * 3)
+
+def _fit(bs, size):
+    if len(bs) > size:
+        message = 'field too long'
+        raise ValueError(message)
+    return bs.ljust(size, b'\0')
+
+def decode_code(bs):
+    return bs.rstrip(b' ').decode()
+
+def encode_code(value):
+    bs = value.encode()
+    if len(bs) > 4:
+        message = 'field too long'
+        raise ValueError(message)
+    return bs.ljust(4, b' ')
+
+def decode_value(bs):
+    return bs.rstrip(b'\0').decode('gb18030')
+
+def encode_value(value, size):
+    return _fit(value.encode('gb18030'), size)
+
+def decode_decomposition(bs):
+    bs = bs.rstrip(b'\0')
+    return ' '.join('%c+%02d' % (c, i) for i, c in zip(bs[::2], bs[1::2]))
+
+def encode_decomposition(value):
+    bs = bytearray()
+    for item in value.split():
+        c, i = item.split('+')
+        bs.append(int(i))
+        bs.append(ord(c))
+    return _fit(bytes(bs), 2 * 4)
+
+def decode_reading(bs):
+    layout = READING_LAYOUTS[len(bs) // 6]
+    items = layout.unpack(bs)
+    parts = []
+    for major, minor in zip(items[::2], items[1::2]):
+        if major == b'\0\0' and minor == b'\0\0\0\0':
+            break
+        parts.append(major.rstrip(b'\0') + b'+' + minor.rstrip(b'\0'))
+    return b' '.join(parts).decode('latin-1')
+
+def encode_reading(value, count):
+    layout = READING_LAYOUTS[count]
+    items = []
+    for item in value.split():
+        major, minor = item.split('+')
+        items.append(_fit(major.encode(), 2))
+        items.append(_fit(minor.encode(), 4))
+    if len(items) > 2 * count:
+        message = 'too many readings'
+        raise ValueError(message)
+    items.extend([b''] * (2 * count - len(items)))
+    return layout.pack(*items)
+
+def decode_reading2(bs):
+    return bs.rstrip(b'\0').decode().replace(',', ' ')
+
+def encode_reading2(value):
+    return _fit(','.join(value.split()).encode(), 223)
+
+def decode_tolerance(bs):
+    parts = []
+    for part in TOLERANCE.unpack(bs):
+        if part == b'\0\0\0\0':
+            break
+        parts.append(part.rstrip(b'\0'))
+    return b' '.join(parts).decode('latin-1')
+
+def encode_tolerance(value):
+    items = [_fit(item.encode(), 4) for item in value.split()]
+    if len(items) > 3:
+        message = 'too many tolerances'
+        raise ValueError(message)
+    items.extend([b''] * (3 - len(items)))
+    return TOLERANCE.pack(*items)
+
+def decode_code6k(bs):
+    return ' '.join(map(str, bs.rstrip(b'\0')))
+
+def encode_code6k(value):
+    return _fit(bytes(map(int, value.split())), 5)
@@ -1,11 +1,16 @@
 ﻿#!py -3
 #encodding: utf-8
 
-__all__ = ('Record', 'Table')
+__all__ = ('Record', 'Table', 'MappedTable', 'ColumnTable')
 
+import os
+import sys
+import array
 import ctypes
 import collections
+import mmap
 import header
+import fields
 
 MAPPING_FROM_TAG_TO_STRING = {
     0: 'null',
@@ -25,6 +30,77 @@ MAPPING_FROM_STRING_TO_TAG = {
     'symbol': 16
 }
 
+STRING_CACHE_SIZE = 4096
+
+def unpack_row(buffer, offset=0):
+    tag, = fields.TAG.unpack_from(buffer, offset)
+    tag = MAPPING_FROM_TAG_TO_STRING[tag]
+    if tag in ('char', 'extended-char'):
+        (_, code, value, decomposition, reading, flag,
+         tolerance, code6k, reading2) = fields.CHAR_RECORD.unpack_from(buffer, offset)
+        return [tag,
+                fields.decode_code(code),
+                fields.decode_value(value),
+                fields.decode_reading(reading),
+                fields.decode_reading2(reading2),
+                fields.decode_decomposition(decomposition),
+                flag,
+                fields.decode_tolerance(tolerance),
+                fields.decode_code6k(code6k)]
+    if tag == 'word':
+        _, code, length, _, value, reading = fields.WORD_RECORD.unpack_from(buffer, offset)
+        return [tag,
+                fields.decode_code(code),
+                fields.decode_value(value),
+                fields.decode_reading(reading),
+                length]
+    _, code, value = fields.STRING_RECORD.unpack_from(buffer, offset)
+    if tag == 'null':
+        return [tag, fields.decode_code(code)]
+    return [tag, fields.decode_code(code), fields.decode_value(value)]
+
+def pack_row(buffer, offset, row):
+    tag = row[0]
+    n = MAPPING_FROM_STRING_TO_TAG[tag]
+    code = fields.encode_code(row[1])
+    if tag in ('char', 'extended-char'):
+        fields.CHAR_RECORD.pack_into(buffer, offset, n, code,
+                                     fields.encode_value(row[2], 4),
+                                     fields.encode_decomposition(row[5]),
+                                     fields.encode_reading(row[3], 7),
+                                     int(row[6]),
+                                     fields.encode_tolerance(row[7]),
+                                     fields.encode_code6k(row[8]),
+                                     fields.encode_reading2(row[4]))
+    elif tag == 'word':
+        fields.WORD_RECORD.pack_into(buffer, offset, n, code, int(row[4]), b'',
+                                     fields.encode_value(row[2], 2 * 32),
+                                     fields.encode_reading(row[3], 32))
+    elif tag == 'null':
+        fields.STRING_RECORD.pack_into(buffer, offset, n, code, b'')
+    else:
+        fields.STRING_RECORD.pack_into(buffer, offset, n, code,
+                                       fields.encode_value(row[2], 296))
+
+def record_dtype():
+    import numpy
+    char = numpy.dtype([('value', 'S4'),
+                        ('decomposition', 'u1', 2 * 4),
+                        ('reading', 'S%d' % (6 * 7)),
+                        ('flag', '<u2'),
+                        ('tolerance', 'S%d' % (4 * 3)),
+                        ('code6k', 'u1', 5),
+                        ('reading2', 'S223')])
+    word = numpy.dtype([('length', 'i1'),
+                        ('reserved', 'V%d' % (7 + 16 * 2)),
+                        ('value', 'S%d' % (2 * 32)),
+                        ('reading', 'S%d' % (6 * 32))])
+    string = numpy.dtype([('value', 'S296')])
+    return numpy.dtype({'names': ['tag', 'code', 'c', 'w', 's'],
+                        'formats': ['<u4', 'S4', char, word, string],
+                        'offsets': [0, 4, 8, 8, 8],
+                        'itemsize': ctypes.sizeof(Record)})
+
 class BaseData(ctypes.LittleEndianStructure):
     pass
 
@@ -66,11 +142,11 @@ class Record(ctypes.LittleEndianStructure):
 
     @property
     def code(self):
-        return bytes(self._code).rstrip(b' ').decode()
+        return fields.decode_code(bytes(self._code))
 
     @code.setter
     def code(self, value):
-        self._code[:] = value.encode().ljust(4, b' ')
+        self._code[:] = fields.encode_code(value)
 
     @property
     def value(self):
@@ -82,41 +158,28 @@ class Record(ctypes.LittleEndianStructure):
             value = self._u._w._value
         elif tag in ('variable', 'symbol'):
             value = self._u._s._value
-        return bytes(value).rstrip(b'\0').decode('gb18030')
+        return fields.decode_value(bytes(value))
 
     @value.setter
     def value(self, value):
         assert self.tag in ('char', 'extended-char', 'word', 'variable', 'symbol')
-        bs = value.encode('gb18030')
         tag = self.tag
         if tag in ('char', 'extended-char'):
-            self._u._c._value[:] = bs.ljust(4, b'\0')
+            self._u._c._value[:] = fields.encode_value(value, 4)
         elif tag == 'word':
-            self._u._w._value[:] = bs.ljust(2 * 32, b'\0')
+            self._u._w._value[:] = fields.encode_value(value, 2 * 32)
         elif tag in ('variable', 'symbol'):
-            self._u._s._value[:] = bs.ljust(296, b'\0')
+            self._u._s._value[:] = fields.encode_value(value, 296)
 
     @property
     def decomposition(self):
         assert self.tag in ('char', 'extended-char')
-        dec = bytes(self._u._c._decomposition).rstrip(b'\0')
-        res = ''
-        for i, c in zip(dec[::2], dec[1::2]):
-            if res:
-                res += ' '
-            res += '%c+%02d' % (c, i)
-        return res
+        return fields.decode_decomposition(bytes(self._u._c._decomposition))
 
     @decomposition.setter
     def decomposition(self, value):
         assert self.tag in ('char', 'extended-char')
-        bs = []
-        for item in value.split():
-            c, i = item.split('+')
-            bs.append(int(i))
-            bs.append(ord(c))
-        bs = bytes(bs)
-        self._u._c._decomposition[:] = bs.ljust(2 * 4, b'\0')
+        self._u._c._decomposition[:] = fields.encode_decomposition(value)
 
     @property
     def flag(self):
@@ -145,80 +208,45 @@ class Record(ctypes.LittleEndianStructure):
             reading = self._u._w._reading
         else:
             reading = self._u._c._reading
-        bs = bytes(reading)
-        res = ''
-        for i in range(0, len(bs), 6):
-            major = ''.join(map(chr, bs[i : i + 2]))
-            minor = ''.join(map(chr, bs[i + 2 : i + 6]))
-            if major == '\0\0' and minor == '\0\0\0\0':
-                break
-            if res:
-                res += ' '
-            res += major.rstrip('\0') + '+' + minor.rstrip('\0')
-        return res
+        return fields.decode_reading(bytes(reading))
 
     @reading.setter
     def reading(self, value):
         assert self.tag in ('char', 'extended-char', 'word')
-        bs = b''
-        for item in value.split():
-            major, minor = item.split('+')
-            bs += major.ljust(2, '\0').encode()
-            bs += minor.ljust(4, '\0').encode()
         if self.tag == 'word':
-            self._u._w._reading[:] = bs.ljust(6 * 32, b'\0')
+            self._u._w._reading[:] = fields.encode_reading(value, 32)
         else:
-            self._u._c._reading[:] = bs.ljust(6 * 7, b'\0')
+            self._u._c._reading[:] = fields.encode_reading(value, 7)
 
     @property
     def reading2(self):
         assert self.tag in ('char', 'extended-char')
-        reading = self._u._c._reading2
-        bs = bytes(reading)
-        bs = bs.rstrip(b'\0').split(b',')
-        res = map(lambda x: x.decode(), bs)
-        return ' '.join(res)
+        return fields.decode_reading2(bytes(self._u._c._reading2))
 
     @reading2.setter
     def reading2(self, value):
         assert self.tag in ('char', 'extended-char')
-        string = ','.join(value.split())
-        self._u._c._reading2[:] = string.encode().ljust(223, b'\0')
+        self._u._c._reading2[:] = fields.encode_reading2(value)
 
     @property
     def tolerance(self):
         assert self.tag in ('char', 'extended-char')
-        bs = bytes(self._u._c._tolerance)
-        res = ''
-        for i in range(0, len(bs), 4):
-            part = ''.join(map(chr, bs[i : i + 4]))
-            if part == '\0\0\0\0':
-                break
-            if res:
-                res += ' '
-            res += part.rstrip('\0')
-        return res
+        return fields.decode_tolerance(bytes(self._u._c._tolerance))
 
     @tolerance.setter
     def tolerance(self, value):
         assert self.tag in ('char', 'extended-char')
-        bs = b''
-        for item in value.split():
-            bs += item.encode().ljust(4, b'\0')
-        self._u._c._tolerance[:] = bs.ljust(4 * 3, b'\0')
+        self._u._c._tolerance[:] = fields.encode_tolerance(value)
 
     @property
     def code6k(self):
         assert self.tag in ('char', 'extended-char')
-        bs = bytes(self._u._c._code6k).rstrip(b'\0')
-        return ' '.join(map(str, bs))
+        return fields.decode_code6k(bytes(self._u._c._code6k))
 
     @code6k.setter
     def code6k(self, value):
         assert self.tag in ('char', 'extended-char')
-        ints = map(int, value.split())
-        bs = bytes(ints).ljust(5, b'\0')
-        self._u._c._code6k[:] = bs
+        self._u._c._code6k[:] = fields.encode_code6k(value)
 
     @classmethod
     def read(cls, fin):
@@ -239,9 +267,15 @@ class Table:
     def add(self, record):
         self._records.append(record)
 
+    def extend(self, records):
+        self._records.extend(records)
+
     def clear(self):
         del self._records[:]
 
+    def __len__(self):
+        return len(self._records)
+
     def load(self, fin):
         head = fin.read(len(header.HEADER_DATA))
         if len(head) != len(header.HEADER_DATA):
@@ -260,6 +294,20 @@ class Table:
         table.load(fin)
         return table
 
+    @classmethod
+    def from_array(cls, array):
+        import numpy
+        array = numpy.ascontiguousarray(array, dtype=record_dtype())
+        records = (Record * len(array)).from_buffer(bytearray(array.tobytes()))
+        table = cls()
+        table.extend(records)
+        return table
+
+    def to_array(self):
+        import numpy
+        bs = bytearray(b''.join(map(bytes, self._records)))
+        return numpy.frombuffer(bs, dtype=record_dtype())
+
     def write(self, fout):
         for record in self:
             record.write(fout)
@@ -270,3 +318,279 @@ class Table:
 
     def __iter__(self):
         return iter(self._records)
+
+class MappedTable:
+    def __init__(self, fin):
+        size = os.fstat(fin.fileno()).st_size - len(header.HEADER_DATA)
+        if size < 0 or size % ctypes.sizeof(Record):
+            message = 'file is corrupt'
+            raise ValueError(message)
+        self._count = size // ctypes.sizeof(Record)
+        self._mapping = None
+        if self._count:
+            self._mapping = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    @classmethod
+    def read(cls, fin):
+        return cls(fin)
+
+    def close(self):
+        if self._mapping is not None:
+            mapping, self._mapping = self._mapping, None
+            try:
+                mapping.close()
+            except BufferError:
+                # Records from __getitem__ or to_array still view the mapping;
+                # it is unmapped when the last of them is released.
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def to_array(self):
+        import numpy
+        if self._mapping is None:
+            return numpy.empty(0, dtype=record_dtype())
+        return numpy.frombuffer(self._mapping, dtype=record_dtype(),
+                                count=self._count,
+                                offset=len(header.HEADER_DATA))
+
+    def rows(self):
+        size = ctypes.sizeof(Record)
+        begin = len(header.HEADER_DATA)
+        for offset in range(begin, begin + self._count * size, size):
+            yield unpack_row(self._mapping, offset)
+
+    def write(self, fout):
+        if self._mapping is not None:
+            fout.write(memoryview(self._mapping)[len(header.HEADER_DATA) : ])
+
+    def dump(self, fout=None):
+        for record in self:
+            print(record.code, file=fout)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            message = 'record index out of range'
+            raise IndexError(message)
+        offset = len(header.HEADER_DATA) + index * ctypes.sizeof(Record)
+        return Record.from_buffer(self._mapping, offset)
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+class StringColumn:
+    # Recently read values are kept decoded, at most cache_size of them, so
+    # reading a field again is free without holding every string twice.
+    def __init__(self, cache_size=STRING_CACHE_SIZE):
+        self._blob = bytearray()
+        self._offsets = array.array('I', [0])
+        self._cache = collections.OrderedDict()
+        self._cache_size = cache_size
+
+    def append(self, value):
+        self._blob += value.encode()
+        self._offsets.append(len(self._blob))
+
+    def clear(self):
+        del self._blob[:]
+        del self._offsets[1:]
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        cache = self._cache
+        value = cache.get(index)
+        if value is not None:
+            cache.move_to_end(index)
+            return value
+        begin = self._offsets[index]
+        end = self._offsets[index + 1]
+        value = self._blob[begin : end].decode()
+        cache[index] = value
+        if len(cache) > self._cache_size:
+            cache.popitem(last=False)
+        return value
+
+class ColumnRecord:
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    @property
+    def tag(self):
+        return MAPPING_FROM_TAG_TO_STRING[self._table._tags[self._index]]
+
+    @property
+    def code(self):
+        return self._table._codes[self._index]
+
+    @property
+    def value(self):
+        assert self.tag in ('char', 'extended-char', 'word', 'variable', 'symbol')
+        return self._table._strings['value'][self._index]
+
+    @property
+    def decomposition(self):
+        assert self.tag in ('char', 'extended-char')
+        return self._table._strings['decomposition'][self._index]
+
+    @property
+    def flag(self):
+        assert self.tag in ('char', 'extended-char')
+        return self._table._flags[self._index]
+
+    @flag.setter
+    def flag(self, value):
+        assert self.tag in ('char', 'extended-char')
+        self._table._flags[self._index] = int(value)
+
+    @property
+    def length(self):
+        assert self.tag == 'word'
+        return self._table._lengths[self._index]
+
+    @property
+    def reading(self):
+        assert self.tag in ('char', 'extended-char', 'word')
+        return self._table._strings['reading'][self._index]
+
+    @property
+    def reading2(self):
+        assert self.tag in ('char', 'extended-char')
+        return self._table._strings['reading2'][self._index]
+
+    @property
+    def tolerance(self):
+        assert self.tag in ('char', 'extended-char')
+        return self._table._strings['tolerance'][self._index]
+
+    @property
+    def code6k(self):
+        assert self.tag in ('char', 'extended-char')
+        return self._table._strings['code6k'][self._index]
+
+    def to_record(self):
+        record = Record()
+        record.tag = self.tag
+        record.code = self.code
+        if self.tag != 'null':
+            record.value = self.value
+        if self.tag == 'word':
+            record.reading = self.reading
+            record.length = self.length
+        elif self.tag in ('char', 'extended-char'):
+            record.reading = self.reading
+            record.reading2 = self.reading2
+            record.decomposition = self.decomposition
+            record.flag = self.flag
+            record.tolerance = self.tolerance
+            record.code6k = self.code6k
+        return record
+
+    def write(self, fout):
+        self.to_record().write(fout)
+
+    def __str__(self):
+        return self.code
+
+class ColumnTable:
+    STRING_FIELDS = ('value', 'reading', 'reading2', 'decomposition',
+                     'tolerance', 'code6k')
+
+    def __init__(self):
+        self._tags = array.array('B')
+        self._flags = array.array('H')
+        self._lengths = array.array('B')
+        self._codes = []
+        self._strings = {name: StringColumn() for name in self.STRING_FIELDS}
+
+    def add(self, record):
+        tag = record.tag
+        strings = dict.fromkeys(self.STRING_FIELDS, '')
+        flag = 0
+        length = 0
+        if tag != 'null':
+            strings['value'] = record.value
+        if tag == 'word':
+            strings['reading'] = record.reading
+            length = record.length
+        elif tag in ('char', 'extended-char'):
+            for name in self.STRING_FIELDS:
+                strings[name] = getattr(record, name)
+            flag = record.flag
+        self._tags.append(MAPPING_FROM_STRING_TO_TAG[tag])
+        self._flags.append(flag)
+        self._lengths.append(length)
+        self._codes.append(sys.intern(record.code))
+        for name, value in strings.items():
+            self._strings[name].append(value)
+
+    def clear(self):
+        del self._tags[:]
+        del self._flags[:]
+        del self._lengths[:]
+        del self._codes[:]
+        for column in self._strings.values():
+            column.clear()
+
+    def load(self, fin):
+        head = fin.read(len(header.HEADER_DATA))
+        if len(head) != len(header.HEADER_DATA):
+            message = 'file is corrupt'
+            raise ValueError(message)
+        while True:
+            record = Record.read(fin)
+            if record:
+                self.add(record)
+            else:
+                break
+
+    @classmethod
+    def read(cls, fin):
+        table = cls()
+        table.load(fin)
+        return table
+
+    @classmethod
+    def from_table(cls, records):
+        table = cls()
+        for record in records:
+            table.add(record)
+        return table
+
+    def write(self, fout):
+        for record in self:
+            record.write(fout)
+
+    def dump(self, fout=None):
+        for record in self:
+            print(record.code, file=fout)
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            message = 'record index out of range'
+            raise IndexError(message)
+        return ColumnRecord(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield ColumnRecord(self, index)
@@ -0,0 +1,274 @@
+﻿#!py -3
+#encodding: utf-8
+
+__all__ = (
+    'configure',
+    'settings',
+    'reset',
+    'stage',
+    'count',
+    'add',
+    'capture',
+    'records',
+    'extend',
+    'report',
+    'write_report',
+    'write_profile',
+)
+
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PROFILERS = ('cprofile', 'tracemalloc')
+
+_local = threading.local()
+_lock = threading.Lock()
+_records = []
+_started = time.perf_counter()
+_profile_stage = None
+_profiler = 'cprofile'
+_profile_output = None
+_profile = None
+
+def configure(profile_stage=None, profiler='cprofile', profile_output=None):
+    global _profile_stage, _profiler, _profile_output, _profile
+    if profiler not in PROFILERS:
+        message = 'unknown profiler %s' % profiler
+        raise ValueError(message)
+    _profile_stage = profile_stage
+    _profiler = profiler
+    _profile_output = profile_output
+    _profile = None
+
+def settings():
+    return _profile_stage, _profiler, _profile_output
+
+def reset():
+    global _started, _profile
+    with _lock:
+        del _records[:]
+    _started = time.perf_counter()
+    _profile = None
+
+def peak_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def _matches(name):
+    if _profile_stage is None:
+        return False
+    last = name.split('/')[-1]
+    return _profile_stage in (name, last, last.split(':')[0], last.split(':')[-1])
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.records = 0
+        self.bytes = 0
+        self.tracemalloc = None
+
+    def to_dict(self):
+        record = {}
+        record['stage'] = self.name
+        record['pid'] = os.getpid()
+        record['start'] = self.start
+        record['wall_seconds'] = self.wall
+        record['cpu_seconds'] = self.cpu
+        record['records'] = self.records
+        record['bytes'] = self.bytes
+        record['peak_rss'] = self.peak_rss
+        if self.tracemalloc is not None:
+            record['tracemalloc'] = self.tracemalloc
+        return record
+
+def _start_profile():
+    global _profile
+    if _profiler == 'cprofile':
+        import cProfile
+        if _profile is None:
+            _profile = cProfile.Profile()
+        try:
+            _profile.enable()
+        except ValueError:
+            return False
+        return True
+    import tracemalloc
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start()
+    return True
+
+def _stop_profile(current):
+    if _profiler == 'cprofile':
+        _profile.disable()
+        return
+    import tracemalloc
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    top = []
+    for statistic in snapshot.statistics('lineno')[ : 20]:
+        frame = statistic.traceback[0]
+        top.append({'line': '%s:%d' % (frame.filename, frame.lineno),
+                    'size': statistic.size,
+                    'count': statistic.count})
+    current.tracemalloc = {'peak': peak, 'top': top}
+
+@contextlib.contextmanager
+def stage(name):
+    stack = _stack()
+    if stack:
+        name = stack[-1].name + '/' + name
+    current = Stage(name)
+    profiling = _matches(name) and _start_profile()
+    stack.append(current)
+    current.start = time.time()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield current
+    finally:
+        current.wall = time.perf_counter() - wall
+        current.cpu = time.process_time() - cpu
+        stack.pop()
+        if profiling:
+            _stop_profile(current)
+        current.peak_rss = peak_rss()
+        with _lock:
+            _records.append(current.to_dict())
+
+def add(name, start, wall, cpu=None, records=0, bytes=0, tracemalloc=None):
+    stack = _stack()
+    if stack:
+        name = stack[-1].name + '/' + name
+    current = Stage(name)
+    current.start = start
+    current.wall = wall
+    current.cpu = cpu
+    current.records = records
+    current.bytes = bytes
+    current.tracemalloc = tracemalloc
+    current.peak_rss = peak_rss()
+    with _lock:
+        _records.append(current.to_dict())
+
+class Capture:
+    # Profiles a stage that runs in slices, like one writer among several in a
+    # single pass. cProfile is switched on and off around each slice; tracemalloc
+    # keeps tracing and only the growth inside the slices is attributed.
+    def __init__(self):
+        self.owner = False
+        self.base = 0
+        self.peak = 0
+        self.retained = 0
+        if _profiler == 'tracemalloc':
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.owner = True
+
+    def resume(self):
+        global _profile
+        if _profiler == 'cprofile':
+            import cProfile
+            if _profile is None:
+                _profile = cProfile.Profile()
+            _profile.enable()
+            return
+        import tracemalloc
+        tracemalloc.reset_peak()
+        self.base = tracemalloc.get_traced_memory()[0]
+
+    def pause(self):
+        if _profiler == 'cprofile':
+            _profile.disable()
+            return
+        import tracemalloc
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak - self.base)
+        self.retained += current - self.base
+
+    def finish(self):
+        if _profiler == 'cprofile':
+            return None
+        if self.owner:
+            import tracemalloc
+            tracemalloc.stop()
+        return {'peak': self.peak, 'retained': self.retained}
+
+def capture(name):
+    stack = _stack()
+    if stack:
+        name = stack[-1].name + '/' + name
+    if not _matches(name):
+        return None
+    return Capture()
+
+def count(records=0, bytes=0):
+    for current in _stack():
+        current.records += records
+        current.bytes += bytes
+
+def records():
+    with _lock:
+        return list(_records)
+
+def extend(items):
+    with _lock:
+        _records.extend(items)
+
+def cpu_seconds(items):
+    if resource is not None:
+        seconds = 0.0
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+            usage = resource.getrusage(who)
+            seconds += usage.ru_utime + usage.ru_stime
+        return seconds
+    # Without rusage, add the top-level stages that ran in worker processes.
+    pid = os.getpid()
+    seconds = time.process_time()
+    for item in items:
+        if item['pid'] != pid and '/' not in item['stage'] and item['cpu_seconds'] is not None:
+            seconds += item['cpu_seconds']
+    return seconds
+
+def report():
+    items = sorted(records(), key=lambda item: item['start'])
+    result = {}
+    result['wall_seconds'] = time.perf_counter() - _started
+    result['cpu_seconds'] = cpu_seconds(items)
+    result['peak_rss'] = peak_rss()
+    result['profile'] = _profile_stage
+    result['stages'] = items
+    return result
+
+def write_report(output):
+    with open(output, 'w', encoding='utf-8') as fout:
+        json.dump(report(), fout, ensure_ascii=False, indent=1)
+
+def write_profile(output=None):
+    if output is None:
+        output = _profile_output
+    if _profile is None or output is None:
+        return None
+    _profile.dump_stats(output)
+    return output
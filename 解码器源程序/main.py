@@ -4,39 +4,95 @@
 import sys
 import os
 import os.path
+import argparse
 
-def decode_wmwb2014():
+def validate_wmwb2014(output, jobs=None):
     root = os.path.dirname(__file__)
     root = os.path.realpath(root)
     if root not in sys.path:
         sys.path.append(root)
     import coders
+    SRC = os.path.join(root, '../大一统2014原始CSV码表')
+    coders.validate_folder(SRC, output, jobs)
+
+def roundtrip_wmwb2014(output):
+    root = os.path.dirname(__file__)
+    root = os.path.realpath(root)
+    if root not in sys.path:
+        sys.path.append(root)
+    import roundtrip
     SRC = os.path.join(root, '../大一统2014原始二进制码表')
-    DST = os.path.join(root, '../大一统2014原始CSV码表')
-    coders.decode_folder(SRC, DST)
+    TEXT = os.path.join(root, '../大一统2014原始CSV码表')
+    PHONE = os.path.join(root, '../大一统2014原始码表 for 百度手机五笔')
+    results = roundtrip.roundtrip_folder(SRC, TEXT, PHONE, output)
+    roundtrip.print_report(results)
+    return all(result['identical'] for result in results)
 
-def encode_wmwb2014():
+def load_instrument():
     root = os.path.dirname(__file__)
     root = os.path.realpath(root)
     if root not in sys.path:
         sys.path.append(root)
-    import coders
-    SRC = os.path.join(root, '../大一统2014原始CSV码表')
-    DST = os.path.join(root, '../大一统2014原始二进制码表2')
-    coders.encode_folder(SRC, DST)
+    import instrument
+    return instrument
 
-def create_tables():
+def build_wmwb2014(targets, versions, jobs, force):
     root = os.path.dirname(__file__)
     root = os.path.realpath(root)
     if root not in sys.path:
         sys.path.append(root)
-    import tables
-    tables.generate_wubis()
+    import build
+    for name in build.run(targets, versions, jobs, force):
+        print(name)
 
 def main():
-    #decode_wmwb2014()
-    #encode_wmwb2014()
-    create_tables()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', '--targets', nargs='+', metavar='TARGET',
+                        choices=('decode', 'encode', 'jidian', 'qq', 'xiaoya',
+                                 'baidu', 'index', 'phone'),
+                        help='stages to build (default: every IME table)')
+    parser.add_argument('-v', '--versions', nargs='+', metavar='VERSION',
+                        choices=('06', '86', '98'),
+                        help='wubi versions to build (default: all)')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='number of worker processes')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='rebuild outputs even if their inputs are unchanged')
+    parser.add_argument('--validate', metavar='REPORT',
+                        help='validate the CSV tables and write a JSON report')
+    parser.add_argument('--roundtrip', metavar='REPORT', nargs='?', const='',
+                        help='decode and re-encode every binary table, compare the '
+                             'results and optionally write a JSON report')
+    parser.add_argument('--report', metavar='REPORT',
+                        help='write per-stage timings as a JSON report')
+    parser.add_argument('--profile', metavar='STAGE',
+                        help='profile the stages with this name, e.g. parse or write:jidian')
+    parser.add_argument('--profiler', choices=('cprofile', 'tracemalloc'), default='cprofile',
+                        help='profiler used for --profile (default: cprofile)')
+    parser.add_argument('--profile-output', metavar='FILE', default='stage.prof',
+                        help='cProfile statistics file (default: stage.prof)')
+    args = parser.parse_args()
+    instrument = load_instrument()
+    instrument.configure(args.profile, args.profiler, args.profile_output)
+    try:
+        run(args)
+    finally:
+        if args.profile is not None:
+            instrument.write_profile()
+        if args.report is not None:
+            instrument.write_report(args.report)
+
+def run(args):
+    if args.validate is not None:
+        validate_wmwb2014(args.validate, args.jobs)
+        return
+    if args.roundtrip is not None:
+        if not roundtrip_wmwb2014(args.roundtrip or None):
+            sys.exit(1)
+        return
+    targets = args.targets or ('jidian', 'qq', 'xiaoya', 'baidu', 'index', 'phone')
+    versions = args.versions or ('06', '86', '98')
+    build_wmwb2014(targets, versions, args.jobs, args.force)
 
 if __name__ == '__main__':
     main()
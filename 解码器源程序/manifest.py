@@ -0,0 +1,86 @@
+﻿#!py -3
+#encodding: utf-8
+
+__all__ = ('Manifest', 'module_files', 'file_mode')
+
+import os
+import os.path
+import hashlib
+import json
+import tempfile
+
+ROOT = os.path.realpath(os.path.dirname(__file__))
+
+_hashes = {}
+
+def _hash_file(path):
+    stat = os.stat(path)
+    key = path, stat.st_size, stat.st_mtime_ns
+    digest = _hashes.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as fin:
+            for bs in iter(lambda: fin.read(1024 * 1024), b''):
+                sha.update(bs)
+        digest = _hashes[key] = sha.hexdigest()
+    return digest
+
+def file_mode():
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+def module_files(*names):
+    return [os.path.join(ROOT, name + '.py') for name in names]
+
+class Manifest:
+    def __init__(self, path):
+        self._path = os.path.realpath(path)
+        self._folder = os.path.dirname(self._path)
+        try:
+            with open(self._path, 'r', encoding='utf-8') as fin:
+                self._entries = json.load(fin)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def _name(self, path):
+        return os.path.relpath(os.path.realpath(path), self._folder).replace(os.sep, '/')
+
+    def hash(self, paths):
+        inputs = {}
+        for path in paths:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    child = os.path.join(path, name)
+                    inputs[self._name(child)] = _hash_file(child)
+            else:
+                inputs[self._name(path)] = _hash_file(path)
+        return inputs
+
+    def fresh(self, output, inputs):
+        if not os.path.exists(output):
+            return False
+        return self._entries.get(self._name(output)) == inputs
+
+    def record(self, output, inputs):
+        self._entries[self._name(output)] = inputs
+
+    def forget(self, output):
+        self._entries.pop(self._name(output), None)
+
+    def __contains__(self, output):
+        return self._name(output) in self._entries
+
+    def save(self, path=None):
+        if path is None:
+            path = self._path
+        fd, name = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as fout:
+                json.dump(self._entries, fout, ensure_ascii=False, indent=1, sort_keys=True)
+            os.chmod(name, file_mode())
+            os.replace(name, path)
+        except BaseException:
+            if os.path.exists(name):
+                os.remove(name)
+            raise
@@ -0,0 +1,112 @@
+﻿#!py -3
+#encodding: utf-8
+
+__all__ = ('Index', 'benchmark')
+
+import bisect
+import itertools
+import time
+
+class Index:
+    def __init__(self, table):
+        self._codes = sorted(table)
+        self._values = {code: tuple(table[code]) for code in self._codes}
+
+    def lookup(self, code):
+        return self._values.get(code, ())
+
+    def range(self, prefix):
+        begin = bisect.bisect_left(self._codes, prefix)
+        end = bisect.bisect_left(self._codes, prefix + '\U0010ffff', begin)
+        return begin, end
+
+    def code(self, i):
+        return self._codes[i]
+
+    def codes(self, prefix):
+        begin, end = self.range(prefix)
+        return map(self._codes.__getitem__, range(begin, end))
+
+    def values(self, prefix):
+        # Candidates only, straight from the stored tuples; use codes() and
+        # lookup() when the codes are needed too.
+        return itertools.chain.from_iterable(map(self._values.__getitem__, self.codes(prefix)))
+
+    def complete(self, prefix):
+        values = self._values
+        for code in self.codes(prefix):
+            for value in values[code]:
+                yield code, value
+
+    def page(self, prefix, offset, limit):
+        return list(itertools.islice(self.complete(prefix), offset, offset + limit))
+
+    def count(self, prefix):
+        begin, end = self.range(prefix)
+        return end - begin
+
+    def __contains__(self, code):
+        return code in self._values
+
+    def __len__(self):
+        return len(self._codes)
+
+def _naive_complete(table, prefix):
+    for code in table:
+        if code.startswith(prefix):
+            for value in table[code]:
+                yield code, value
+
+def benchmark(table, prefixes=('a', 'ab', 'abc', 'y', 'yt'), repeat=1000):
+    index = Index(table)
+    codes = list(index.codes(''))[ : : max(1, len(index) // 1000)]
+    result = {}
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for code in codes:
+            index.lookup(code)
+    elapsed = time.perf_counter() - start
+    result['lookup'] = elapsed / (repeat * len(codes))
+
+    start = time.perf_counter()
+    for _ in range(repeat // 100 or 1):
+        for prefix in prefixes:
+            for _ in index.complete(prefix):
+                pass
+    result['complete'] = (time.perf_counter() - start) / ((repeat // 100 or 1) * len(prefixes))
+
+    start = time.perf_counter()
+    for _ in range(repeat // 100 or 1):
+        for prefix in prefixes:
+            for _ in index.values(prefix):
+                pass
+    result['values'] = (time.perf_counter() - start) / ((repeat // 100 or 1) * len(prefixes))
+
+    start = time.perf_counter()
+    for _ in range(repeat // 100 or 1):
+        for prefix in prefixes:
+            for _ in _naive_complete(table, prefix):
+                pass
+    result['naive_complete'] = (time.perf_counter() - start) / ((repeat // 100 or 1) * len(prefixes))
+
+    for prefix in prefixes:
+        assert list(index.complete(prefix)) == sorted(_naive_complete(table, prefix),
+                                                      key=lambda x: x[0])
+        assert list(index.values(prefix)) == [value for _, value in index.complete(prefix)]
+    return result
+
+def main():
+    import os.path
+    import tables
+    version = '86'
+    name = tables.NAMES[tables.VERSIONS.index(version)]
+    table, _, _ = tables.load_wangma_wubi(
+        version, name,
+        os.path.join(tables.SRC, 'wmwb%sqm.dat.txt' % version),
+        os.path.join(tables.SRC, 'wmwb%sjm.dat.txt' % version))
+    for key, seconds in benchmark(table).items():
+        print('%-16s %12.3f us' % (key, seconds * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,24 @@
 ﻿#!py -3
 #encodding: utf-8
 
-__all__ = ('Record', 'Table')
+__all__ = ('Record', 'Table', 'MappedTable', 'unpack_glyphs')
 
+import os
 import ctypes
+import mmap
+import struct
 import header
 
+ATLAS_MAGIC = b'WMZGATL1'
+ATLAS_HEAD = struct.Struct('<8sI')
+ATLAS_ENTRY = struct.Struct('<4sI')
+GLYPH_SIZE = 64
+
+def unpack_glyphs(data):
+    import numpy
+    bs = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 16, 4)
+    return numpy.unpackbits(bs[:, ::-1, : 2], axis=2)
+
 class Record(ctypes.LittleEndianStructure):
     _fields_ = [('_letter', ctypes.c_byte),
                 ('_major', ctypes.c_byte),
@@ -66,6 +79,9 @@ class Table:
     def clear(self):
         self._records.clear()
 
+    def __len__(self):
+        return len(self._records)
+
     def load(self, fin):
         while True:
             record = Record.read(fin)
@@ -80,6 +96,47 @@ class Table:
         table.load(fin)
         return table
 
+    def load_atlas(self, fin):
+        head = fin.read(ATLAS_HEAD.size)
+        if len(head) != ATLAS_HEAD.size:
+            message = 'atlas is corrupt'
+            raise ValueError(message)
+        magic, count = ATLAS_HEAD.unpack(head)
+        if magic != ATLAS_MAGIC:
+            message = 'atlas is corrupt'
+            raise ValueError(message)
+        index = fin.read(ATLAS_ENTRY.size * count)
+        data = fin.read()
+        if len(index) != ATLAS_ENTRY.size * count:
+            message = 'atlas is corrupt'
+            raise ValueError(message)
+        for code, offset in ATLAS_ENTRY.iter_unpack(index):
+            if offset + GLYPH_SIZE > len(data):
+                message = 'atlas is corrupt'
+                raise ValueError(message)
+            record = Record()
+            record.code = code.decode('ascii')
+            record.data = data[offset : offset + GLYPH_SIZE]
+            self.add(record)
+
+    @classmethod
+    def read_atlas(cls, fin):
+        table = cls()
+        table.load_atlas(fin)
+        return table
+
+    def write_atlas(self, fout):
+        codes = sorted(self._records)
+        fout.write(ATLAS_HEAD.pack(ATLAS_MAGIC, len(codes)))
+        for i, code in enumerate(codes):
+            fout.write(ATLAS_ENTRY.pack(code.encode('ascii'), i * GLYPH_SIZE))
+        fout.write(b''.join(self._records[code].data for code in codes))
+
+    def glyphs(self):
+        codes = sorted(self._records)
+        data = b''.join(self._records[code].data for code in codes)
+        return codes, unpack_glyphs(data)
+
     def write(self, fout):
         for code in sorted(self._records):
             record = self._records[code]
@@ -91,3 +148,65 @@ class Table:
 
     def __iter__(self):
         return iter(self._records.values())
+
+class MappedTable:
+    def __init__(self, fin):
+        size = os.fstat(fin.fileno()).st_size
+        if size % ctypes.sizeof(Record):
+            message = 'file is corrupt'
+            raise ValueError(message)
+        self._mapping = None
+        self._offsets = {}
+        if size:
+            self._mapping = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+            for offset in range(0, size, ctypes.sizeof(Record)):
+                self._offsets[self._mapping[offset : offset + 3]] = offset
+        self._keys = sorted(self._offsets)
+
+    @classmethod
+    def read(cls, fin):
+        return cls(fin)
+
+    def close(self):
+        if self._mapping is not None:
+            mapping, self._mapping = self._mapping, None
+            try:
+                mapping.close()
+            except BufferError:
+                # A view of the mapping is still alive; dropping our reference
+                # leaves the unmap to whoever releases it last.
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def _key(code):
+        assert len(code) == 4
+        assert code[1] == '+'
+        return code[0].upper().encode('ascii') + code[2 : ].encode('ascii')
+
+    def data(self, code):
+        offset = self._offsets[self._key(code)] + Record._data.offset
+        return self._mapping[offset : offset + GLYPH_SIZE]
+
+    def get(self, code):
+        offset = self._offsets[self._key(code)]
+        return Record.from_buffer_copy(self._mapping, offset)
+
+    def codes(self):
+        for key in self._keys:
+            yield '%c+%c%c' % (chr(key[0]).lower(), key[1], key[2])
+
+    def __contains__(self, code):
+        return self._key(code) in self._offsets
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        for code in self.codes():
+            yield self.get(code)
@@ -0,0 +1,99 @@
+﻿#!py -3
+#encodding: utf-8
+
+__all__ = ('ReverseIndex', )
+
+import csv
+import tables
+
+class ReverseIndex:
+    def __init__(self):
+        self._full = {}
+        self._short = {}
+        self._longest = 1
+
+    def _add(self, mapping, value, code):
+        codes = mapping.get(value)
+        if codes is None:
+            codes = mapping[value] = {}
+            self._longest = max(self._longest, len(value))
+        codes[code] = None
+
+    def add_full(self, value, code):
+        self._add(self._full, value, code)
+
+    def add_short(self, value, code):
+        self._add(self._short, value, code)
+
+    def load(self, version, ftab, stab):
+        # The merged table also holds the short codes implied by the char flags,
+        # so every code it has that is not a full code is a short code.
+        table = tables.merge_wangma_wubi(version, ftab, stab)
+        for record in ftab:
+            if record.tag in ('char', 'extended-char', 'word'):
+                self.add_full(record.value, record.code)
+        for code, values in table.items():
+            for value in values:
+                if code not in self._full.get(value, ()):
+                    self.add_short(value, code)
+
+    @classmethod
+    def from_tables(cls, version, ftab, stab):
+        index = cls()
+        index.load(version, ftab, stab)
+        return index
+
+    def full_codes(self, value):
+        return list(self._full.get(value, ()))
+
+    def short_codes(self, value):
+        return list(self._short.get(value, ()))
+
+    def codes(self, value):
+        return list(dict.fromkeys(self.full_codes(value) + self.short_codes(value)))
+
+    def lookup(self, values):
+        return [self.codes(value) for value in values]
+
+    def convert(self, text):
+        result = []
+        i = 0
+        while i < len(text):
+            for n in range(min(self._longest, len(text) - i), 0, -1):
+                segment = text[i : i + n]
+                if segment in self._full or segment in self._short:
+                    break
+            else:
+                segment = text[i]
+            result.append((segment, self.codes(segment)))
+            i += len(segment)
+        return result
+
+    @classmethod
+    def read(cls, fin):
+        index = cls()
+        for row in csv.reader(fin):
+            value = row[0]
+            for code in row[1].split():
+                index.add_full(value, code)
+            for code in row[2].split():
+                index.add_short(value, code)
+        return index
+
+    def write(self, fout):
+        writer = csv.writer(fout)
+        for value in self:
+            row = []
+            row.append(value)
+            row.append(' '.join(self._full.get(value, ())))
+            row.append(' '.join(self._short.get(value, ())))
+            writer.writerow(row)
+
+    def __contains__(self, value):
+        return value in self._full or value in self._short
+
+    def __iter__(self):
+        yield from self._full
+        for value in self._short:
+            if value not in self._full:
+                yield value
@@ -0,0 +1,140 @@
+﻿#!py -3
+#encodding: utf-8
+
+__all__ = ('roundtrip_file', 'roundtrip_phone_file', 'roundtrip_folder', 'print_report')
+
+import os
+import os.path
+import glob
+import json
+import time
+import ctypes
+import tempfile
+import header
+import fields
+import radical
+import shortcut
+import coders
+import baiduphone
+
+def _count_radical(size):
+    return size // ctypes.sizeof(radical.Record)
+
+def _count_shortcut(size):
+    return (size - len(header.HEADER_DATA)) // shortcut.RECORD.size
+
+def _count_fullcode(size):
+    return (size - len(header.HEADER_DATA)) // fields.RECORD_SIZE
+
+MODULES = (
+    ('radical', '*zg.dat', _count_radical,
+     coders.decode_radical_folder, coders.encode_radical_file),
+    ('shortcut', '*jm.dat', _count_shortcut,
+     coders.decode_shortcut_file, coders.encode_shortcut_stream),
+    ('fullcode', '*qm.dat', _count_fullcode,
+     coders.decode_fullcode_file, coders.stream_fullcode_file),
+)
+
+def _stage(seconds, records, size):
+    stage = {}
+    stage['seconds'] = seconds
+    stage['records_per_second'] = records / seconds if seconds else 0.0
+    stage['megabytes_per_second'] = size / seconds / 1e6 if seconds else 0.0
+    return stage
+
+def _compare(path, data):
+    with open(path, 'rb') as fin:
+        return fin.read() == data
+
+def roundtrip_file(module, input, folder):
+    for name, _, count, decode, encode in MODULES:
+        if name == module:
+            break
+    else:
+        message = 'unknown module %s' % module
+        raise ValueError(message)
+    base = os.path.join(folder, os.path.basename(input))
+    text = base if module == 'radical' else base + '.txt'
+    binary = base + '.out'
+    size = os.path.getsize(input)
+    records = count(size)
+
+    start = time.perf_counter()
+    decode(input, text)
+    decoded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encode(text, binary)
+    encoded = time.perf_counter() - start
+
+    with open(binary, 'rb') as fin:
+        data = fin.read()
+    result = {}
+    result['file'] = os.path.basename(input)
+    result['module'] = module
+    result['records'] = records
+    result['bytes'] = size
+    result['identical'] = _compare(input, data)
+    result['decode'] = _stage(decoded, records, size)
+    result['encode'] = _stage(encoded, records, len(data))
+    return result
+
+def roundtrip_phone_file(input):
+    size = os.path.getsize(input)
+
+    start = time.perf_counter()
+    with open(input, 'rb') as fin:
+        file = baiduphone.File.read(fin)
+    decoded = time.perf_counter() - start
+    if file is None:
+        message = '%s is corrupt' % input
+        raise ValueError(message)
+
+    start = time.perf_counter()
+    data = file.compile()
+    encoded = time.perf_counter() - start
+
+    records = len(file.records)
+    result = {}
+    result['file'] = os.path.basename(input)
+    result['module'] = 'baiduphone'
+    result['records'] = records
+    result['bytes'] = size
+    result['identical'] = _compare(input, data)
+    result['decode'] = _stage(decoded, records, size)
+    result['encode'] = _stage(encoded, records, len(data))
+    return result
+
+def roundtrip_folder(src, text=None, phone=None, output=None):
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for module, pattern, *_ in MODULES:
+            inputs = sorted(glob.glob(os.path.join(src, pattern)))
+            if module == 'fullcode' and text is not None:
+                names = {os.path.basename(input) for input in inputs}
+                for path in sorted(glob.glob(os.path.join(text, pattern + '.txt'))):
+                    name = os.path.basename(path)[ : -4]
+                    if name not in names:
+                        seed = os.path.join(folder, 'seed')
+                        os.makedirs(seed, exist_ok=True)
+                        seed = os.path.join(seed, name)
+                        coders.stream_fullcode_file(path, seed)
+                        inputs.append(seed)
+            for input in inputs:
+                results.append(roundtrip_file(module, input, folder))
+    if phone is not None:
+        for input in sorted(glob.glob(os.path.join(phone, '*.def'))):
+            results.append(roundtrip_phone_file(input))
+    if output is not None:
+        with open(output, 'w', encoding='utf-8') as fout:
+            json.dump(results, fout, ensure_ascii=False, indent=1)
+    return results
+
+def print_report(results):
+    for result in results:
+        for stage in ('decode', 'encode'):
+            print('%-16s %-10s %-6s %12.0f rec/s %10.2f MB/s %s' % (
+                result['file'], result['module'], stage,
+                result[stage]['records_per_second'],
+                result[stage]['megabytes_per_second'],
+                'ok' if result['identical'] else 'MISMATCH'))
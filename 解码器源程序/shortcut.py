@@ -1,11 +1,16 @@
 ﻿#!py -3
 #encodding: utf-8
 
-__all__ = ('Record', 'Table')
+__all__ = ('Record', 'Table', 'DenseTable', 'find')
 
+import os
 import ctypes
+import operator
+import itertools
 import collections
+import struct
 import header
+import fields
 
 S1_BEGIN = 0
 S1_END   = 24
@@ -14,56 +19,82 @@ S2_END   = 30 + 30 * 24 + 25
 S3_BEGIN = 930 + 1
 S3_END   = 930 + 900 * 24 + 30 * 24 + 25
 
+RECORD = struct.Struct('<I4s')
+
+def index_to_code(index):
+    if S1_BEGIN <= index <= S1_END:
+        offset = index - S1_BEGIN
+        c1 = chr(ord('a') + offset)
+        return c1
+    if S2_BEGIN <= index <= S2_END:
+        offset = index - S2_BEGIN
+        c1 = chr(ord('a') + offset // 30)
+        c2 = chr(ord('a') + offset % 30)
+        return c1 + c2
+    if S3_BEGIN <= index <= S3_END:
+        offset = index - S3_BEGIN
+        c1 = chr(ord('a') + offset // 900)
+        c2 = chr(ord('a') + offset // 30 % 30)
+        c3 = chr(ord('a') + offset % 30)
+        return c1 + c2 + c3
+    message = 'invalid index'
+    raise ValueError(message)
+
+def code_to_index(code):
+    assert 1 <= len(code) <= 3
+    assert code.islower()
+    if len(code) == 1:
+        n1 = ord(code[0]) - ord('a')
+        index = S1_BEGIN + n1
+    elif len(code) == 2:
+        n1 = ord(code[0]) - ord('a')
+        n2 = ord(code[1]) - ord('a')
+        index = S2_BEGIN + 30 * n1 + n2
+    else:
+        n1 = ord(code[0]) - ord('a')
+        n2 = ord(code[1]) - ord('a')
+        n3 = ord(code[2]) - ord('a')
+        index = S3_BEGIN + 900 * n1 + 30 * n2 + n3
+    return index
+
+INDEX_COUNT = S3_END + 1
+CODES = [None] * INDEX_COUNT
+for _index in range(INDEX_COUNT):
+    if S1_END < _index < S2_BEGIN or S2_END < _index < S3_BEGIN:
+        continue
+    CODES[_index] = index_to_code(_index)
+INDICES = {code: index for index, code in enumerate(CODES) if code is not None}
+del _index
+
+def codes_to_indices(codes):
+    return list(map(INDICES.__getitem__, codes))
+
+def indices_to_codes(indices):
+    return list(map(CODES.__getitem__, indices))
+
+def pack_row(buffer, offset, row):
+    RECORD.pack_into(buffer, offset, code_to_index(row[0]),
+                     fields.encode_value(row[1], 4))
+
 class Record(ctypes.LittleEndianStructure):
     _fields_ = [('_index', ctypes.c_uint32),
                 ('_value',  ctypes.c_byte * 4)]
 
     @property
     def code(self):
-        index = self._index
-        if S1_BEGIN <= index <= S1_END:
-            offset = index - S1_BEGIN
-            c1 = chr(ord('a') + offset)
-            return c1
-        if S2_BEGIN <= index <= S2_END:
-            offset = index - S2_BEGIN
-            c1 = chr(ord('a') + offset // 30)
-            c2 = chr(ord('a') + offset % 30)
-            return c1 + c2
-        if S3_BEGIN <= index <= S3_END:
-            offset = index - S3_BEGIN
-            c1 = chr(ord('a') + offset // 900)
-            c2 = chr(ord('a') + offset // 30 % 30)
-            c3 = chr(ord('a') + offset % 30)
-            return c1 + c2 + c3
-        message = 'invalid index'
-        raise ValueError(message)
+        return index_to_code(self._index)
 
     @code.setter
     def code(self, value):
-        assert 1 <= len(value) <= 3
-        assert value.islower()
-        if len(value) == 1:
-            n1 = ord(value[0]) - ord('a')
-            index = S1_BEGIN + n1
-        elif len(value) == 2:
-            n1 = ord(value[0]) - ord('a')
-            n2 = ord(value[1]) - ord('a')
-            index = S2_BEGIN + 30 * n1 + n2
-        else:
-            n1 = ord(value[0]) - ord('a')
-            n2 = ord(value[1]) - ord('a')
-            n3 = ord(value[2]) - ord('a')
-            index = S3_BEGIN + 900 * n1 + 30 * n2 + n3
-        self._index = index
+        self._index = code_to_index(value)
 
     @property
     def value(self):
-        return bytes(self._value).rstrip(b'\0').decode('gb18030')
+        return fields.decode_value(bytes(self._value))
 
     @value.setter
     def value(self, value):
-        self._value[:] = value.encode('gb18030').ljust(4, b'\0')
+        self._value[:] = fields.encode_value(value, 4)
 
     @classmethod
     def read(cls, fin):
@@ -120,3 +151,96 @@ class Table:
     def __iter__(self):
         for code in sorted(self._records, key=lambda x: (len(x), x)):
             yield from self._records[code]
+
+class DenseTable:
+    def __init__(self):
+        self._slots = [None] * INDEX_COUNT
+        self._count = 0
+
+    def add(self, record):
+        slot = self._slots[record._index]
+        if slot is None:
+            slot = self._slots[record._index] = []
+        slot.append(record)
+        self._count += 1
+
+    def extend(self, records):
+        # Runs of one code land in their slot in a single list extend.
+        slots = self._slots
+        for index, group in itertools.groupby(records, operator.attrgetter('_index')):
+            slot = slots[index]
+            if slot is None:
+                slot = slots[index] = []
+            size = len(slot)
+            slot.extend(group)
+            self._count += len(slot) - size
+
+    def remove(self, code):
+        index = INDICES[code]
+        slot = self._slots[index]
+        if slot is not None:
+            self._count -= len(slot)
+            self._slots[index] = None
+
+    def clear(self):
+        self._slots = [None] * INDEX_COUNT
+        self._count = 0
+
+    def get(self, code):
+        return list(self._slots[INDICES[code]] or ())
+
+    def load(self, fin):
+        head = fin.read(len(header.HEADER_DATA))
+        if len(head) != len(header.HEADER_DATA):
+            message = 'file is corrupt'
+            raise ValueError(message)
+        while True:
+            record = Record.read(fin)
+            if record:
+                self.add(record)
+            else:
+                break
+
+    @classmethod
+    def read(cls, fin):
+        table = cls()
+        table.load(fin)
+        return table
+
+    def write(self, fout):
+        for record in self:
+            record.write(fout)
+
+    def dump(self, fout=None):
+        for record in self:
+            print(record.code, file=fout)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for slot in self._slots:
+            if slot is not None:
+                yield from slot
+
+def find(fin, code):
+    index = code_to_index(code)
+    begin = len(header.HEADER_DATA)
+    size = ctypes.sizeof(Record)
+    lo = 0
+    hi = (os.fstat(fin.fileno()).st_size - begin) // size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        fin.seek(begin + mid * size)
+        if RECORD.unpack(fin.read(size))[0] < index:
+            lo = mid + 1
+        else:
+            hi = mid
+    fin.seek(begin + lo * size)
+    records = []
+    while True:
+        record = Record.read(fin)
+        if not record or record._index != index:
+            break
+        records.append(record)
+    return records
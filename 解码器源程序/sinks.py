@@ -0,0 +1,193 @@
+﻿#!py -3
+#encodding: utf-8
+
+__all__ = (
+    'Sink',
+    'JidianSink',
+    'QQSink',
+    'XiaoyaSink',
+    'BaiduSink',
+    'BaiduPhoneSink',
+    'emit',
+)
+
+import os
+import time
+import charset
+import baiduphone
+import instrument
+
+TEXT_BOM = b'\xff\xfe'
+TEXT_BATCH_LINES = 16384
+
+class Sink:
+    name = 'sink'
+
+    def open(self):
+        pass
+
+    def write(self, code, values):
+        raise NotImplementedError
+
+    def finish(self):
+        pass
+
+    def close(self):
+        pass
+
+    def size(self):
+        return 0
+
+class TextSink(Sink):
+    def __init__(self, output):
+        self._output = output
+        self._fout = None
+        self._lines = []
+
+    def open(self):
+        self._fout = open(self._output, 'wb')
+        self._fout.write(TEXT_BOM)
+        self._lines = []
+
+    def _line(self, line):
+        self._lines.append(line)
+        if len(self._lines) >= TEXT_BATCH_LINES:
+            self._flush()
+
+    def _flush(self):
+        if self._lines:
+            self._lines.append('')
+            self._fout.write('\r\n'.join(self._lines).encode('utf-16-le'))
+            self._lines = []
+
+    def finish(self):
+        self._flush()
+
+    def close(self):
+        self._lines = []
+        if self._fout is not None:
+            self._fout.close()
+            self._fout = None
+
+    def size(self):
+        return os.path.getsize(self._output)
+
+class JidianSink(TextSink):
+    name = 'jidian'
+
+    def write(self, code, values):
+        items = [code]
+        for value in values:
+            if not charset.is_gb2312(value):
+                value = '~' + value
+            items.append(value)
+        self._line(' '.join(items))
+
+class QQSink(TextSink):
+    name = 'qq'
+
+    def write(self, code, values):
+        self._line(' '.join([code, *values]))
+
+class XiaoyaSink(TextSink):
+    name = 'xiaoya'
+
+    def __init__(self, output, name=None):
+        super().__init__(output)
+        if name is None:
+            name = output
+        self._name = name
+
+    def open(self):
+        super().open()
+        self._line('[cmd:RefCode]')
+        self._line('[cmd:RemoveAll]')
+        self._line('[cmd:Info=%s]' % self._name)
+
+    def write(self, code, values):
+        self._line(' '.join([code, *values]))
+
+class BaiduSink(TextSink):
+    name = 'baidu'
+
+    def write(self, code, values):
+        for value in reversed(values):
+            self._line('%s\t%s' % (value, code))
+
+class BaiduPhoneSink(Sink):
+    name = 'phone'
+
+    def __init__(self, output):
+        self._output = output
+        self._fout = None
+        self._writer = None
+
+    def open(self):
+        self._fout = open(self._output, 'wb')
+        self._writer = baiduphone.Writer(self._fout)
+
+    def write(self, code, values):
+        self._writer.write(code, values)
+
+    def finish(self):
+        self._writer.close()
+
+    def close(self):
+        self._writer = None
+        if self._fout is not None:
+            self._fout.close()
+            self._fout = None
+
+    def size(self):
+        return os.path.getsize(self._output)
+
+def emit(table, sinks):
+    timer = time.perf_counter
+    clock = time.process_time
+    start = time.time()
+    elapsed = [0.0] * len(sinks)
+    cpu = [0.0] * len(sinks)
+    captures = [instrument.capture('write:%s' % sink.name) for sink in sinks]
+
+    def call(i, function, *args):
+        capture = captures[i]
+        if capture is not None:
+            capture.resume()
+        begin = timer()
+        begin_cpu = clock()
+        function(*args)
+        elapsed[i] += timer() - begin
+        cpu[i] += clock() - begin_cpu
+        if capture is not None:
+            capture.pause()
+
+    opened = []
+    try:
+        for i, sink in enumerate(sinks):
+            call(i, sink.open)
+            opened.append(sink)
+        with instrument.stage('sort') as stage:
+            codes = sorted(table)
+            stage.records = len(codes)
+        for code in codes:
+            values = table[code]
+            for i, sink in enumerate(sinks):
+                capture = captures[i]
+                if capture is not None:
+                    capture.resume()
+                begin = timer()
+                begin_cpu = clock()
+                sink.write(code, values)
+                elapsed[i] += timer() - begin
+                cpu[i] += clock() - begin_cpu
+                if capture is not None:
+                    capture.pause()
+        for i, sink in enumerate(sinks):
+            call(i, sink.finish)
+    finally:
+        for sink in opened:
+            sink.close()
+    for i, sink in enumerate(sinks):
+        capture = captures[i]
+        instrument.add('write:%s' % sink.name, start, elapsed[i], cpu[i], len(codes),
+                       sink.size(), capture.finish() if capture is not None else None)
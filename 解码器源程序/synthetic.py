@@ -0,0 +1,147 @@
+﻿#!py -3
+#encodding: utf-8
+
+__all__ = (
+    'fullcode_rows',
+    'shortcut_rows',
+    'write_rows',
+    'generate_folder',
+)
+
+import os
+import os.path
+import csv
+import random
+import argparse
+import itertools
+import bisect
+import coders
+import shortcut
+
+LETTERS = 'abcdefghijklmnopqrstuvwxy'
+FULLCODE_SPACE = len(LETTERS) ** 4
+SHORTCUT_CODES = [code for code in shortcut.CODES
+                  if code is not None and all(c in LETTERS for c in code)]
+SYLLABLES = ('b+u', 'h+e', 'l+i', 'd+e', 'zh+ong', 'g+uo', 'r+en', 'sh+i', 'y+ou', 'w+o')
+DISTRIBUTIONS = ('uniform', 'zipf')
+
+def _hanzi():
+    chars = []
+    for major in range(0xB0, 0xD8):
+        for minor in range(0xA1, 0xFF):
+            try:
+                chars.append(bytes([major, minor]).decode('gb2312'))
+            except UnicodeError:
+                pass
+    return chars
+
+HANZI = _hanzi()
+
+def _fullcode(rank):
+    # Spread neighbouring ranks over the code space; 7 is coprime with 25 ** 4.
+    index = rank * 7 ** 7 % FULLCODE_SPACE
+    code = ''
+    for _ in range(4):
+        index, n = divmod(index, len(LETTERS))
+        code = LETTERS[n] + code
+    return code
+
+def _sampler(rng, count, distribution, skew):
+    if distribution == 'uniform':
+        return lambda: rng.randrange(count)
+    if distribution == 'zipf':
+        weights = list(itertools.accumulate(1 / (k + 1) ** skew for k in range(count)))
+        total = weights[-1]
+        return lambda: min(bisect.bisect(weights, rng.random() * total), count - 1)
+    message = 'unknown distribution %s' % distribution
+    raise ValueError(message)
+
+def fullcode_rows(n, codes=None, distribution='uniform', skew=1.1, words=0.6, seed=0):
+    rng = random.Random(seed)
+    if codes is None:
+        codes = n * 3 // 4
+    codes = max(1, min(codes, FULLCODE_SPACE))
+    sample = _sampler(rng, codes, distribution, skew)
+    chars = []
+    phrases = []
+    for _ in range(n):
+        code = _fullcode(sample())
+        if rng.random() < words:
+            length = rng.randint(2, 4)
+            value = ''.join(rng.choice(HANZI) for _ in range(length))
+            reading = ' '.join(rng.choice(SYLLABLES) for _ in range(length))
+            phrases.append(['word', code, value, reading, str(length)])
+        else:
+            reading = rng.choice(SYLLABLES)
+            reading2 = reading.replace('+', '') + str(rng.randint(1, 5))
+            decomposition = ' '.join('%c+%02d' % (c, rng.randint(1, 20)) for c in code)
+            row = ['char', code, rng.choice(HANZI), reading, reading2, decomposition,
+                   str(rng.randint(0, 7)), '', '']
+            chars.append(row)
+    chars.sort(key=lambda row: row[1])
+    phrases.sort(key=lambda row: row[1])
+    return chars + phrases
+
+def shortcut_rows(n, codes=None, distribution='uniform', skew=1.1, seed=0):
+    rng = random.Random(seed)
+    if codes is None:
+        codes = n
+    codes = max(1, min(codes, len(SHORTCUT_CODES)))
+    chosen = rng.sample(SHORTCUT_CODES, codes)
+    sample = _sampler(rng, codes, distribution, skew)
+    rows = [[chosen[sample()], rng.choice(HANZI)] for _ in range(n)]
+    rows.sort(key=lambda row: shortcut.INDICES[row[0]])
+    return rows
+
+def write_rows(rows, output):
+    with open(output, 'w', encoding='utf-8-sig', newline='') as fout:
+        writer = csv.writer(fout)
+        writer.writerows(rows)
+
+def generate_folder(folder, n, name='wmwbsyn', binary=None, codes=None,
+                    distribution='uniform', skew=1.1, shortcuts=None, seed=0):
+    os.makedirs(folder, exist_ok=True)
+    if shortcuts is None:
+        shortcuts = min(n // 16 + 1, len(SHORTCUT_CODES))
+    fullcode_output = os.path.join(folder, name + 'qm.dat.txt')
+    shortcut_output = os.path.join(folder, name + 'jm.dat.txt')
+    write_rows(fullcode_rows(n, codes, distribution, skew, seed=seed), fullcode_output)
+    write_rows(shortcut_rows(shortcuts, None, distribution, skew, seed=seed), shortcut_output)
+    outputs = [fullcode_output, shortcut_output]
+    if binary is not None:
+        os.makedirs(binary, exist_ok=True)
+        output = os.path.join(binary, name + 'qm.dat')
+        coders.stream_fullcode_file(fullcode_output, output)
+        outputs.append(output)
+        output = os.path.join(binary, name + 'jm.dat')
+        coders.encode_shortcut_table(shortcut_output, output)
+        outputs.append(output)
+    return outputs
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder',
+                        help='folder for the generated CSV tables')
+    parser.add_argument('-n', '--records', type=int, default=72000,
+                        help='number of qm records')
+    parser.add_argument('-c', '--codes', type=int,
+                        help='number of distinct qm codes (default: 3/4 of the records)')
+    parser.add_argument('-d', '--distribution', choices=DISTRIBUTIONS, default='uniform',
+                        help='how records are spread over the codes')
+    parser.add_argument('-s', '--skew', type=float, default=1.1,
+                        help='exponent of the zipf distribution')
+    parser.add_argument('--shortcuts', type=int,
+                        help='number of jm records')
+    parser.add_argument('--name', default='wmwbsyn',
+                        help='table name prefix')
+    parser.add_argument('--binary', metavar='FOLDER',
+                        help='also encode the tables into this folder')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for output in generate_folder(args.folder, args.records, args.name, args.binary,
+                                  args.codes, args.distribution, args.skew,
+                                  args.shortcuts, args.seed):
+        print(output)
+
+if __name__ == '__main__':
+    main()
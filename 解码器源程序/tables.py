@@ -2,18 +2,48 @@
 #encodding: utf-8
 
 __all__ = (
+    'CodeTable',
     'load_wangma_wubi',
+    'merge_wangma_wubi',
     'generate_jidian_wubi',
     'generate_qq_wubi',
     'generate_xiaoya_wubi',
     'generate_baidu_wubi',
+    'generate_jidian_wubi_index',
+    'generate_baidu_phone_wubi',
+    'generate_wubi',
     'generate_wubis',
 )
 
 import os
 import os.path
-import coders
-import baiduphone
+import cache
+import charset
+import sinks
+import manifest
+import instrument
+
+ROOT = os.path.realpath(os.path.dirname(__file__))
+SRC = os.path.join(ROOT, '../大一统2014原始CSV码表')
+DST = os.path.join(ROOT, '../大一统2014原始码表 for %s/wmwb%s.txt')
+DST_INDEX = os.path.join(ROOT, '../大一统2014原始码表 for %s/wmwb%s.freeime.dat')
+DST_PHONE = os.path.join(ROOT, '../大一统2014原始码表 for %s/wmwb%s.def')
+
+MANIFEST = os.path.join(ROOT, '../.manifest.json')
+
+VERSIONS = '06', '86', '98'
+NAMES = '新世纪五笔', '86-18030', '98五笔'
+TARGETS = 'jidian', 'qq', 'xiaoya', 'baidu', 'index', 'phone'
+FOLDERS = {
+    'jidian': '极点五笔',
+    'qq': 'QQ五笔',
+    'xiaoya': '小鸭五笔',
+    'baidu': '百度五笔',
+    'index': '极点五笔索引',
+    'phone': '百度手机五笔'
+}
+GENERATOR_MODULES = ('header', 'fields', 'fullcode', 'shortcut', 'coders',
+                     'cache', 'tables', 'sinks', 'charset', 'baiduphone')
 
 WUBI_SHORT1 = {
     '我' : 'q',
@@ -25,19 +55,70 @@ WUBI_SHORT1 = {
     '发' : 'v'
 }
 
+class CodeTable:
+    def __init__(self):
+        self._values = {}
+        self._codes = {}
+        self._size = 0
+
+    def add(self, code, value):
+        values = self._values.get(code)
+        if values is None:
+            values = self._values[code] = {}
+        if value in values:
+            return False
+        values[value] = None
+        codes = self._codes.get(value)
+        if codes is None:
+            codes = self._codes[value] = {}
+        codes[code] = None
+        self._size += 1
+        return True
+
+    def codes_of(self, value):
+        return self._codes.get(value, {}).keys()
+
+    def count(self, code):
+        values = self._values.get(code)
+        return len(values) if values else 0
+
+    def items(self):
+        for code, values in self._values.items():
+            yield code, values.keys()
+
+    @property
+    def size(self):
+        return self._size
+
+    def __contains__(self, code):
+        return code in self._values
+
+    def __getitem__(self, code):
+        return self._values[code].keys()
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
 def load_wangma_wubi(version, name, fullcode_input, shortcut_input):
-    ftab = coders.encode_fullcode_file(fullcode_input)
-    stab = coders.encode_shortcut_file(shortcut_input)
-    table = {}
+    with instrument.stage('parse') as stage:
+        ftab = cache.load_fullcode_file(fullcode_input)
+        stab = cache.load_shortcut_file(shortcut_input)
+        stage.records = len(ftab) + len(stab)
+
+    with instrument.stage('merge') as stage:
+        table = merge_wangma_wubi(version, ftab, stab)
+        stage.records = table.size
 
-    def add_pair(code, value):
-        if code not in table:
-            table[code] = []
-        if value not in table[code]:
-            table[code].append(value)
+    return table, ftab, stab
+
+def merge_wangma_wubi(version, ftab, stab):
+    table = CodeTable()
 
     for record in stab:
-        add_pair(record.code, record.value)
+        table.add(record.code, record.value)
 
     for record in ftab:
         if record.tag == 'char':
@@ -50,99 +131,98 @@ def load_wangma_wubi(version, name, fullcode_input, shortcut_input):
             if record.flag & 0x1:
                 c = record.code[ : 1]
                 c = WUBI_SHORT1.get(record.value, c)
-                add_pair(c, record.value)
+                table.add(c, record.value)
             if record.flag & 0x2:
-                add_pair(record.code[ : 2], record.value)
+                table.add(record.code[ : 2], record.value)
             if record.flag & 0x4:
-                add_pair(record.code[ : 3], record.value)
+                table.add(record.code[ : 3], record.value)
         else:
             break
 
     for record in ftab:
         if record.tag in ('char', 'word', 'extended-char'):
-            add_pair(record.code, record.value)
+            table.add(record.code, record.value)
 
-    return table, ftab, stab
+    return table
 
 def generate_jidian_wubi(table, output):
-    with open(output, 'w', encoding='utf-16', newline='\r\n') as fout:
-        for code in sorted(table):
-            string = code
-            for value in table[code]:
-                try:
-                    value.encode('gb2312')
-                except UnicodeError:
-                    value = '~' + value
-                string += ' ' + value
-            print(string, file=fout)
+    sinks.emit(table, [sinks.JidianSink(output)])
 
 def generate_qq_wubi(table, output):
-    with open(output, 'w', encoding='utf-16', newline='\r\n') as fout:
-        for code in sorted(table):
-            string = code
-            for value in table[code]:
-                string += ' ' + value
-            print(string, file=fout)
+    sinks.emit(table, [sinks.QQSink(output)])
 
 def generate_xiaoya_wubi(table, output, name=None):
-    with open(output, 'w', encoding='utf-16', newline='\r\n') as fout:
-        if name is None:
-            name = output
-        print('[cmd:RefCode]', file=fout)
-        print('[cmd:RemoveAll]', file=fout)
-        print('[cmd:Info=%s]' % name, file=fout)
-        for code in sorted(table):
-            string = code
-            for value in table[code]:
-                string += ' ' + value
-            print(string, file=fout)
+    sinks.emit(table, [sinks.XiaoyaSink(output, name)])
 
 def generate_baidu_wubi(table, output):
-    with open(output, 'w', encoding='utf-16', newline='\r\n') as fout:
-        for code in sorted(table):
-            for value in reversed(table[code]):
-                string = '%s\t%s' % (value, code)
-                print(string, file=fout)
+    sinks.emit(table, [sinks.BaiduSink(output)])
 
 def generate_jidian_wubi_index(ftab, output):
-    with open(output, 'w', encoding='ascii', newline='\r\n') as fout:
-        mapping = {}
-        for record in ftab:
-            if record.tag == 'char':
-                mapping[record.value] = record.code
-        def key_function(value):
-            return value.encode('gb18030')
-        for value in sorted(mapping, key=key_function):
-            print(mapping[value].ljust(4), end='', file=fout)
+    with instrument.stage('write:index') as stage:
+        with open(output, 'w', encoding='ascii', newline='\r\n') as fout:
+            mapping = {}
+            for record in ftab:
+                if record.tag == 'char':
+                    mapping[record.value] = record.code
+            for value in sorted(mapping, key=charset.gb18030_char_key):
+                print(mapping[value].ljust(4), end='', file=fout)
+        stage.records = len(mapping)
+        stage.bytes = os.path.getsize(output)
 
 def generate_baidu_phone_wubi(table, output):
-    with open(output, 'wb') as fout:
-        file = baiduphone.File()
-        for code in sorted(table):
-            for value in table[code]:
-                record = baiduphone.Record()
-                record.value = value
-                record.codes.append(code)
-                file.records.append(record)
-        bs = file.compile()
-        fout.write(bs)
-
-def generate_wubis():
-    root = os.path.dirname(__file__)
-    root = os.path.realpath(root)
-    SRC = os.path.join(root, '../大一统2014原始CSV码表')
-    DST = os.path.join(root, '../大一统2014原始码表 for %s/wmwb%s.txt')
-    DST_INDEX = os.path.join(root, '../大一统2014原始码表 for %s/wmwb%s.freeime.dat')
-    DST_PHONE = os.path.join(root, '../大一统2014原始码表 for %s/wmwb%s.def')
-    VERSIONS = '06', '86', '98'
-    NAMES = '新世纪五笔', '86-18030', '98五笔'
-    for version, name in zip(VERSIONS, NAMES):
+    sinks.emit(table, [sinks.BaiduPhoneSink(output)])
+
+def target_output(version, target):
+    if target == 'index':
+        return DST_INDEX % (FOLDERS[target], version)
+    if target == 'phone':
+        return DST_PHONE % (FOLDERS[target], version)
+    return DST % (FOLDERS[target], version)
+
+def target_inputs(version):
+    return [os.path.join(SRC, 'wmwb%sqm.dat.txt' % version),
+            os.path.join(SRC, 'wmwb%sjm.dat.txt' % version),
+            *manifest.module_files(*GENERATOR_MODULES)]
+
+def generate_wubi(version, targets=TARGETS, built=None):
+    if built is not None:
+        inputs = built.hash(target_inputs(version))
+        targets = [target for target in targets
+                   if not built.fresh(target_output(version, target), inputs)]
+        if not targets:
+            return []
+    with instrument.stage('generate:%s' % version):
+        name = NAMES[VERSIONS.index(version)]
         fullcode_input = os.path.join(SRC, 'wmwb%sqm.dat.txt' % version)
         shortcut_input = os.path.join(SRC, 'wmwb%sjm.dat.txt' % version)
         table, ftab, stab = load_wangma_wubi(version, name, fullcode_input, shortcut_input)
-        generate_jidian_wubi(table, DST % ('极点五笔', version))
-        generate_qq_wubi(table, DST % ('QQ五笔', version))
-        generate_xiaoya_wubi(table, DST % ('小鸭五笔', version), name)
-        generate_baidu_wubi(table, DST % ('百度五笔', version))
-        generate_jidian_wubi_index(ftab, DST_INDEX % ('极点五笔索引', version))
-        generate_baidu_phone_wubi(table, DST_PHONE % ('百度手机五笔', version))
+        writers = []
+        if 'jidian' in targets:
+            writers.append(sinks.JidianSink(target_output(version, 'jidian')))
+        if 'qq' in targets:
+            writers.append(sinks.QQSink(target_output(version, 'qq')))
+        if 'xiaoya' in targets:
+            writers.append(sinks.XiaoyaSink(target_output(version, 'xiaoya'), name))
+        if 'baidu' in targets:
+            writers.append(sinks.BaiduSink(target_output(version, 'baidu')))
+        if 'phone' in targets:
+            writers.append(sinks.BaiduPhoneSink(target_output(version, 'phone')))
+        if writers:
+            sinks.emit(table, writers)
+        if 'index' in targets:
+            generate_jidian_wubi_index(ftab, target_output(version, 'index'))
+    outputs = [target_output(version, target) for target in targets]
+    if built is not None:
+        for output in outputs:
+            built.record(output, inputs)
+    return outputs
+
+def generate_wubis(force=False):
+    built = manifest.Manifest(MANIFEST)
+    for version in VERSIONS:
+        generate_wubi(version, built=None if force else built)
+        if force:
+            inputs = built.hash(target_inputs(version))
+            for target in TARGETS:
+                built.record(target_output(version, target), inputs)
+    built.save()